@@ -7,3 +7,14 @@ TWITCH_BROWSER_OAUTH_TOKEN = ""
 VLC_PATH = ""  #eg. "C:/Program Files (x86)/VideoLAN/VLC/vlc.exe" or "/Applications/VLC.app/Contents/MacOS/VLC"
 
 EXPORT_METADATAS_PATH = "metadatas"
+FINGERPRINTS_PATH = "fingerprints"
+DOWNLOAD_WORKERS = 4  # ffmpeg decoding time ranges of an HLS reference at once, 1 to download it in one go
+SEARCH_WORKERS = 0  # Processes used by the parallel search, 0 for one per core
+EARLY_EXIT_CONFIDENCE = 0.8  # Streamed reference searches stop once every chunk matched above this, 0 to always read it all
+MEMORY_BUDGET = 0  # MB a job should stay under (search chunks and parallel workers are sized from it), 0 for no limit
+MEMORY_TRACE = False  # Also log tracemalloc peaks per stage, slower
+MEDIA_CACHE_PATH = "media_cache"  # Downloaded audio shared by the jobs, reruns don't download it again
+MEDIA_CACHE_SIZE = 4096  # MB, the least recently used audio is removed past it, 0 to disable the cache
+DURATIONS_CACHE_PATH = "durations_cache.json"  # Durations of ended VODs, looked up once
+STREAMS_CACHE_PATH = "streams_cache.json"  # Stream urls resolved by streamlink, kept until they expire
+MATCHERS_CALIBRATION_PATH = "matchers_calibration.json"  # Cached timings of the search backends, used by backend="auto"
@@ -0,0 +1,145 @@
+import os
+import json
+import math
+import time
+import tempfile
+
+import numpy as np
+import soundfile
+
+import detection.sound
+import detection.fingerprint
+import detection.pcm
+
+
+# Picks the fastest matcher of detection.sound.MATCHERS for a template length, a reference length and
+# the cores of this machine. Each matcher is timed once on two synthetic references and its search
+# time is fitted as overhead + cost per second of reference, so the choice extrapolates to references
+# of any length. Fits are cached per (template length, core count), the calibration only runs once.
+
+RATE = 8000
+CALIBRATION_DURATIONS = (60, 240)
+MAX_OFFSET_ERROR = 0.05
+
+# The loop scores aren't normalized, so they can't be compared with the find_offset thresholds
+EXCLUDED_MATCHERS = {"loop"}
+
+
+def get_template_bucket(template_duration):
+    # Template lengths are bucketed to powers of two seconds
+    return 2 ** round(math.log2(max(template_duration, 1)))
+
+
+def get_calibration_key(template_duration, cores):
+    return f"{get_template_bucket(template_duration)}s_{cores}cores"
+
+
+def generate_calibration_source(duration, rate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(duration * rate) / rate
+
+    sound = 0.1 * rng.standard_normal(t.shape[0])
+
+    for freq in rng.uniform(100, 1500, 6):
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(0.05, 0.5) * t + rng.uniform(0, 2 * np.pi))
+        sound += 0.2 * envelope * np.sin(2 * np.pi * freq * t)
+
+    return (sound / np.abs(sound).max()).astype(np.float32)
+
+
+def time_matcher(matcher, source_path, template_path):
+    if matcher == "fingerprint":
+        # find_offset builds the index of a reference once and keeps it, only the lookup is searching
+        index = detection.fingerprint.build_index(source_path)
+
+        t_start = time.time()
+        found_time, found_value = detection.fingerprint.find_audio_sample(index, template_path, source_path)
+
+        return time.time() - t_start, found_time
+
+    t_start = time.time()
+    found_time, found_value = detection.sound.MATCHERS[matcher](source_path, template_path)
+
+    return time.time() - t_start, found_time
+
+
+def calibrate(template_duration, rate=RATE, durations=CALIBRATION_DURATIONS):
+    fits = {}
+
+    rng = np.random.default_rng(1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cases = []
+
+        for duration in durations:
+            source_sound = generate_calibration_source(max(duration, 2 * template_duration), rate)
+
+            template_start = round(0.6 * (source_sound.shape[0] - template_duration * rate))
+            template_sound = source_sound[template_start:template_start + template_duration * rate]
+            template_sound = template_sound + 0.05 * rng.standard_normal(template_sound.shape[0]).astype(np.float32)
+
+            source_path = os.path.join(tmp_dir, f"source_{duration}.pcm")
+            detection.pcm.write_pcm(source_path, [source_sound], rate)
+
+            template_path = os.path.join(tmp_dir, f"template_{duration}.wav")
+            soundfile.write(template_path, template_sound, rate)
+
+            cases.append((source_sound.shape[0] / rate, source_path, template_path, template_start / rate))
+
+        for matcher in detection.sound.MATCHERS:
+            if matcher in EXCLUDED_MATCHERS:
+                continue
+
+            # Untimed first run : lazy imports and caches would be counted as overhead
+            time_matcher(matcher, cases[0][1], cases[0][2])
+
+            search_times = []
+
+            for duration, source_path, template_path, expected_time in cases:
+                search_time, found_time = time_matcher(matcher, source_path, template_path)
+
+                if abs(found_time - expected_time) > MAX_OFFSET_ERROR:
+                    break
+
+                search_times.append((duration, search_time))
+            else:
+                (duration_a, time_a), (duration_b, time_b) = search_times[0], search_times[-1]
+
+                cost = max((time_b - time_a) / (duration_b - duration_a), 0.)
+                fits[matcher] = (max(time_a - cost * duration_a, 0.), cost)
+
+    return fits
+
+
+def load_calibrations(cache_path):
+    if not os.path.exists(cache_path):
+        return {}
+
+    with open(cache_path, "r") as fp:
+        return json.load(fp)
+
+
+def save_calibrations(cache_path, calibrations):
+    # Written next to the cache then renamed, concurrent jobs never read half a file
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+
+    with open(tmp_path, "w") as fp:
+        json.dump(calibrations, fp, indent=4)
+
+    os.replace(tmp_path, cache_path)
+
+
+def choose_matcher(template_duration, source_duration, cache_path):
+    key = get_calibration_key(template_duration, os.cpu_count())
+    calibrations = load_calibrations(cache_path)
+
+    if key not in calibrations:
+        calibrations[key] = calibrate(get_template_bucket(template_duration))
+        save_calibrations(cache_path, calibrations)
+
+    fits = calibrations[key]
+
+    if not fits:
+        raise Exception(f"<!!> No matcher passed the calibration for {key}")
+
+    return min(fits, key=lambda matcher: fits[matcher][0] + fits[matcher][1] * source_duration)
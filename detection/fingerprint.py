@@ -0,0 +1,210 @@
+import os
+
+import numpy as np
+import librosa
+import scipy.ndimage
+
+from detection.sound import get_source_info, stream_source, load_template, refine_audio_sample, MATCHERS
+
+
+# Landmark fingerprinting : pairs of spectral peaks are hashed as (anchor freq, target freq, time delta)
+# and stored with the anchor time. A template is located by looking up its hashes and voting on
+# the time offset between matching reference and template landmarks.
+# See https://www.ee.columbia.edu/~dpwe/papers/Wang03-shazam.pdf
+
+N_FFT = 1024
+HOP_LENGTH = 128
+BLOCK_LENGTH = 2048
+
+PEAK_NEIGHBORHOOD = (15, 15)   # (freq bins, frames)
+FAN_OUT = 5
+MAX_TIME_DELTA = 127
+MAX_HASH_HITS = 2000
+REFINE_MARGIN = 0.5  # Seconds searched at full rate around the voted offset
+
+
+def get_index_path(index_dir, video_id, video_service):
+    return f"{index_dir}/{video_service}_{video_id}.npz"
+
+
+def find_peaks(spectrogram, frame_offset=0):
+    log_spectrogram = librosa.amplitude_to_db(spectrogram, ref=np.max)
+
+    is_peak = scipy.ndimage.maximum_filter(log_spectrogram, size=PEAK_NEIGHBORHOOD, mode="constant", cval=-np.inf) == log_spectrogram
+    is_peak &= log_spectrogram > np.mean(log_spectrogram) + np.std(log_spectrogram)
+
+    freqs, frames = np.nonzero(is_peak)
+
+    return frames + frame_offset, freqs
+
+
+def hash_peaks(frames, freqs, n_anchors=None):
+    # Only the first n_anchors peaks are paired with their FAN_OUT next ones, when the peaks after the
+    # last given one aren't known yet
+    order = np.lexsort((freqs, frames))
+    frames = frames[order]
+    freqs = freqs[order]
+
+    if n_anchors is None:
+        n_anchors = frames.shape[0]
+
+    hashes = [np.zeros(0, dtype=np.uint32)]
+    times = [np.zeros(0, dtype=np.int32)]
+
+    for i_target in range(1, FAN_OUT + 1):
+        n_pairs = min(n_anchors, frames.shape[0] - i_target)
+
+        if n_pairs <= 0:
+            break
+
+        dt = frames[i_target:i_target + n_pairs] - frames[:n_pairs]
+        is_valid = (dt > 0) & (dt <= MAX_TIME_DELTA)
+
+        hashes.append((freqs[:n_pairs][is_valid].astype(np.uint32) << 17) | (freqs[i_target:i_target + n_pairs][is_valid].astype(np.uint32) << 7) | dt[is_valid].astype(np.uint32))
+        times.append(frames[:n_pairs][is_valid].astype(np.int32))
+
+    return np.concatenate(hashes), np.concatenate(times)
+
+
+def iter_fingerprints(sound_stream):
+    # Hashes block by block : a peak is hashed as soon as its FAN_OUT next peaks are known, the last
+    # ones of a block wait for the next. Same landmarks as hashing the peaks of the whole sound at once.
+    pending_frames = np.zeros(0, dtype=np.int64)
+    pending_freqs = np.zeros(0, dtype=np.int64)
+
+    frame_offset = 0
+
+    for block in sound_stream:
+        if block.shape[0] < N_FFT:
+            continue
+
+        spectrogram = np.abs(librosa.stft(block, n_fft=N_FFT, hop_length=HOP_LENGTH, center=False))
+
+        frames, freqs = find_peaks(spectrogram, frame_offset)
+        order = np.lexsort((freqs, frames))
+
+        frames = np.concatenate((pending_frames, frames[order]))
+        freqs = np.concatenate((pending_freqs, freqs[order]))
+
+        frame_offset += spectrogram.shape[1]
+
+        if frames.shape[0] > FAN_OUT:
+            yield hash_peaks(frames, freqs, frames.shape[0] - FAN_OUT)
+
+        pending_frames = frames[-FAN_OUT:]
+        pending_freqs = freqs[-FAN_OUT:]
+
+    if pending_frames.shape[0]:
+        yield hash_peaks(pending_frames, pending_freqs)
+
+
+def get_fingerprints(sound_stream):
+    hashes_list = [np.zeros(0, dtype=np.uint32)]
+    times_list = [np.zeros(0, dtype=np.int32)]
+
+    for hashes, times in iter_fingerprints(sound_stream):
+        hashes_list.append(hashes)
+        times_list.append(times)
+
+    # Sound shorter than one FFT frame : no landmark at all
+    return np.concatenate(hashes_list), np.concatenate(times_list)
+
+
+def build_index(source_path):
+    # Only the index itself grows with the reference : it is packed as (hash, time) keys sorted in
+    # place, about twice its final size at the peak. The index is always held whole in memory.
+    source_rate, source_length = get_source_info(source_path)
+
+    source_stream = stream_source(source_path,
+                                  block_length=BLOCK_LENGTH,
+                                  frame_length=N_FFT,
+                                  hop_length=HOP_LENGTH)
+
+    keys_list = [np.zeros(0, dtype=np.uint64)]
+
+    for hashes, times in iter_fingerprints(source_stream):
+        keys_list.append((hashes.astype(np.uint64) << np.uint64(32)) | times.astype(np.uint64))
+
+    keys = np.concatenate(keys_list)
+    del keys_list
+
+    keys.sort()
+
+    return {
+        "hashes": (keys >> np.uint64(32)).astype(np.uint32),
+        "times": (keys & np.uint64(0xFFFFFFFF)).astype(np.int32),
+        "rate": source_rate,
+    }
+
+
+def get_index_size(index):
+    return index["hashes"].nbytes + index["times"].nbytes
+
+
+def save_index(index_path, index):
+    index_dir = os.path.dirname(index_path)
+
+    if index_dir and not (os.path.exists(index_dir) and os.path.isdir(index_dir)):
+        os.makedirs(index_dir)
+
+    np.savez(index_path, hashes=index["hashes"], times=index["times"], rate=index["rate"])
+
+
+def load_index(index_path):
+    with np.load(index_path) as index_file:
+        return {
+            "hashes": index_file["hashes"],
+            "times": index_file["times"],
+            "rate": int(index_file["rate"]),
+        }
+
+
+def find_audio_sample(index, template_path, source_path=None, template_rate=None):
+    # The votes only tell where the template is, to a hop. With the reference audio, the offset is
+    # refined at full rate and the confidence is the normalized correlation of the other matchers.
+    template_sound = load_template(template_path, rate=index["rate"], template_rate=template_rate)
+
+    template_hashes, template_times = get_fingerprints([template_sound])
+
+    if template_hashes.shape[0] == 0:
+        return -1, 0
+
+    hits_start = np.searchsorted(index["hashes"], template_hashes, side="left")
+    hits_count = np.searchsorted(index["hashes"], template_hashes, side="right") - hits_start
+
+    # Hashes found all over the reference (silence, steady tones) don't tell anything about the offset
+    hits_count[hits_count > MAX_HASH_HITS] = 0
+
+    total_hits = np.sum(hits_count)
+
+    if total_hits == 0:
+        return -1, 0
+
+    hits_rank = np.arange(total_hits) - np.repeat(np.cumsum(hits_count) - hits_count, hits_count)
+    hits_index = np.repeat(hits_start, hits_count) + hits_rank
+
+    offsets = index["times"][hits_index] - np.repeat(template_times, hits_count)
+    offsets = offsets[offsets >= 0]
+
+    if offsets.shape[0] == 0:
+        return -1, 0
+
+    votes = np.bincount(offsets)
+    best_offset = np.argmax(votes)
+
+    found_time = best_offset * HOP_LENGTH / index["rate"]
+
+    if source_path is not None:
+        return refine_audio_sample(source_path, template_sound, index["rate"], found_time, REFINE_MARGIN)
+
+    # Share of the template landmarks agreeing on the offset : only meaningful between fingerprint searches
+    confidence = votes[best_offset] / template_hashes.shape[0]
+
+    return found_time, confidence
+
+
+def find_audio_sample_in_source(source_path, template_path):
+    return find_audio_sample(build_index(source_path), template_path, source_path)
+
+
+MATCHERS["fingerprint"] = find_audio_sample_in_source
@@ -0,0 +1,81 @@
+import os
+import struct
+
+import numpy as np
+import librosa
+
+
+# Raw decoded mono PCM, memory-mapped so searches and parallel workers share the same pages
+# through the OS page cache instead of decoding the audio again.
+# Layout : 64 bytes header (magic, rate, dtype, length in samples) followed by the samples.
+
+PCM_MAGIC = b"VODPCM01"
+PCM_HEADER = struct.Struct("<8sI4sQ")
+PCM_HEADER_SIZE = 64
+PCM_DTYPES = {
+    "f4": np.float32,
+    "i2": np.int16,
+}
+
+
+def is_pcm_path(path):
+    return os.path.splitext(path)[1].lower() == ".pcm"
+
+
+def write_pcm(pcm_path, sound_stream, rate, dtype="f4"):
+    length = 0
+
+    with open(pcm_path, "wb") as fp:
+        fp.write(b"\0" * PCM_HEADER_SIZE)
+
+        for block in sound_stream:
+            if dtype == "i2":
+                block = np.clip(np.round(block * 32767), -32768, 32767)
+
+            fp.write(np.ascontiguousarray(block, dtype=PCM_DTYPES[dtype]).tobytes())
+            length += block.shape[0]
+
+        fp.seek(0)
+        fp.write(PCM_HEADER.pack(PCM_MAGIC, rate, dtype.encode().ljust(4, b"\0"), length))
+
+    return length
+
+
+def convert_to_pcm(source_path, pcm_path, dtype="f4", block_length=1 << 16):
+    source_rate = librosa.get_samplerate(source_path)
+
+    source_stream = librosa.stream(source_path,
+                                   block_length=block_length,
+                                   frame_length=1,
+                                   hop_length=1)
+
+    write_pcm(pcm_path, source_stream, source_rate, dtype)
+
+
+def read_pcm_header(pcm_path):
+    with open(pcm_path, "rb") as fp:
+        magic, rate, dtype, length = PCM_HEADER.unpack(fp.read(PCM_HEADER.size))
+
+    if magic != PCM_MAGIC:
+        raise Exception(f"<!!> {pcm_path} is not a PCM cache file")
+
+    return rate, dtype.rstrip(b"\0").decode(), length
+
+
+def open_pcm(pcm_path):
+    rate, dtype, length = read_pcm_header(pcm_path)
+
+    if length == 0:
+        return np.zeros(0, dtype=PCM_DTYPES[dtype]), rate
+
+    sound = np.memmap(pcm_path, dtype=PCM_DTYPES[dtype], mode="r", offset=PCM_HEADER_SIZE, shape=(length,))
+
+    return sound, rate
+
+
+def to_float(sound):
+    # float32 slices stay views of the memory map, int16 ones are converted block by block
+    if sound.dtype == np.int16:
+        return sound.astype(np.float32) / 32768.
+
+    return sound
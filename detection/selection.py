@@ -0,0 +1,80 @@
+import numpy as np
+
+
+# Picks the part of a permanent video that is the most likely to give a sharp correlation peak,
+# from a cheap low-rate envelope : frame loudness (dB) and spectral entropy (0 for a pure tone,
+# 1 for white noise). Silent windows are useless, and steady music gives broad, ambiguous peaks,
+# so a window scores higher the more of it is active, the more its loudness moves and the more
+# its spectrum is spread.
+
+FRAME_DURATION = 0.1
+N_FFT = 512
+MIN_LOUDNESS = -50
+
+
+def get_envelope(sound_stream, rate, frame_duration=FRAME_DURATION):
+    frame_length = round(frame_duration * rate)
+    window = np.hanning(frame_length)
+
+    loudness_list = []
+    entropy_list = []
+
+    buffer = np.zeros(0, dtype=np.float32)
+
+    for block in sound_stream:
+        buffer = np.concatenate((buffer, block))
+
+        n_frames = buffer.shape[0] // frame_length
+
+        if n_frames == 0:
+            continue
+
+        frames = buffer[:n_frames * frame_length].reshape(n_frames, frame_length)
+        buffer = buffer[n_frames * frame_length:]
+
+        loudness_list.append(10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10))
+
+        power = np.abs(np.fft.rfft(frames * window, max(N_FFT, frame_length), axis=1)) ** 2
+        p = power / np.maximum(np.sum(power, axis=1, keepdims=True), 1e-20)
+        entropy_list.append(-np.sum(p * np.log(np.maximum(p, 1e-20)), axis=1) / np.log(power.shape[1]))
+
+    if not loudness_list:
+        return np.zeros(0), np.zeros(0)
+
+    return np.concatenate(loudness_list), np.concatenate(entropy_list)
+
+
+def get_window_scores(loudness, entropy, window_frames, min_loudness=MIN_LOUDNESS):
+    n_windows = loudness.shape[0] - window_frames + 1
+
+    if n_windows <= 0:
+        return np.zeros(0)
+
+    def moving_sum(x):
+        cumsum = np.concatenate(([0.], np.cumsum(x)))
+        return cumsum[window_frames:] - cumsum[:n_windows]
+
+    is_active = loudness > min_loudness
+    active_loudness = np.where(is_active, loudness, 0.)
+
+    # Loudness moves are measured on the active frames only : a jump to silence isn't a distinctive sound
+    n_active = moving_sum(is_active)
+    activity = n_active / window_frames
+    mean_loudness = moving_sum(active_loudness) / np.maximum(n_active, 1)
+    dynamics = np.sqrt(np.maximum(moving_sum(active_loudness ** 2) / np.maximum(n_active, 1) - mean_loudness ** 2, 0.))
+    spread = moving_sum(np.where(is_active, entropy, 0.)) / window_frames
+
+    return activity * dynamics * spread
+
+
+def select_template_window(loudness, entropy, window_duration, frame_duration=FRAME_DURATION, min_loudness=MIN_LOUDNESS):
+    # Returns the window start in seconds from the beginning of the envelope, and its score
+    window_frames = max(1, round(window_duration / frame_duration))
+    scores = get_window_scores(loudness, entropy, window_frames, min_loudness)
+
+    if scores.shape[0] == 0:
+        return 0., 0.
+
+    i_best = np.argmax(scores)
+
+    return i_best * frame_duration, scores[i_best]
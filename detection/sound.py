@@ -1,9 +1,21 @@
 import os
+import glob
 import math
 import time
+import functools
+import contextlib
+import multiprocessing
+import concurrent.futures
 
 import numpy as np
 import librosa
+import soundfile
+import scipy.signal
+
+from detection.pcm import is_pcm_path, read_pcm_header, open_pcm, to_float, write_pcm
+
+
+FFT_BYTES_PER_SAMPLE = 48  # Rough working set of an FFT chunk, per sample and per template
 
 
 # Implementation based on https://stackoverflow.com/questions/52572693/find-sound-effect-inside-an-audio-file
@@ -23,18 +35,18 @@ def format_time(t):
 
 
 def find_audio_sample(source_path, template_path):
-    template_sound, template_rate = librosa.load(template_path, sr=None)
+    source_rate, source_length = get_source_info(source_path)
 
-    source_rate = librosa.get_samplerate(source_path)
+    template_sound = load_template(template_path, rate=source_rate)
 
     frame_length = len(template_sound)
     block_length = 1024
     hop_length = 128      # 512
 
-    source_stream = librosa.stream(source_path,
-                                   block_length=block_length,
-                                   frame_length=frame_length,
-                                   hop_length=int(hop_length))
+    source_stream = stream_source(source_path,
+                                  block_length=block_length,
+                                  frame_length=frame_length,
+                                  hop_length=int(hop_length))
 
     max_value = 0
     max_time = -1
@@ -63,10 +75,574 @@ def find_audio_sample(source_path, template_path):
     return max_time, max_value
 
 
+def load_template(template, rate=None, template_rate=None):
+    # Templates are either audio files or samples already in memory (e.g. streamed from ffmpeg). Samples
+    # in memory are only resampled when their rate (template_rate) is given.
+    if isinstance(template, np.ndarray):
+        if rate and template_rate and template_rate != rate:
+            template = librosa.resample(template, orig_sr=template_rate, target_sr=rate)
+
+        return template.astype(np.float32, copy=False)
+
+    template_sound, template_rate = librosa.load(template, sr=rate)
+    return template_sound
+
+
+def get_source_info(source_path):
+    if is_pcm_path(source_path):
+        source_rate, dtype, length = read_pcm_header(source_path)
+        return source_rate, length
+
+    source_info = soundfile.info(source_path)
+    return source_info.samplerate, source_info.frames
+
+
+def stream_source(source_path, block_length, frame_length=1, hop_length=1, start=0, stop=None):
+    # Same blocks as librosa.stream : block_length frames per block, consecutive blocks overlapping
+    # by frame_length - hop_length samples. PCM caches are sliced straight from the memory map.
+    block_size = (block_length - 1) * hop_length + frame_length
+
+    if is_pcm_path(source_path):
+        sound, source_rate = open_pcm(source_path)
+        stop = sound.shape[0] if stop is None else min(stop, sound.shape[0])
+
+        for block_start in range(start, stop, block_length * hop_length):
+            block = sound[block_start:min(block_start + block_size, stop)]
+
+            if block.shape[0] < frame_length:
+                break
+
+            yield to_float(block)
+
+    elif start == 0 and stop is None:
+        yield from librosa.stream(source_path,
+                                  block_length=block_length,
+                                  frame_length=frame_length,
+                                  hop_length=hop_length)
+
+    else:
+        for block in soundfile.blocks(source_path, blocksize=block_size, overlap=frame_length - hop_length, start=start, stop=stop, dtype="float32", always_2d=True):
+            if block.shape[0] < frame_length:
+                break
+
+            yield librosa.to_mono(block.T)
+
+
+def load_source_range(source_path, start, stop):
+    start = max(0, start)
+
+    if is_pcm_path(source_path):
+        sound, source_rate = open_pcm(source_path)
+        return to_float(sound[start:stop])
+
+    sound, source_rate = soundfile.read(source_path, start=start, stop=stop, dtype="float32", always_2d=True)
+    return librosa.to_mono(sound.T)
+
+
+def get_fft_length(frame_length, n_templates=1, memory_budget=None):
+    # Power of two at least twice the template so each FFT yields as many valid lags as the template length
+    fft_length = 2 ** math.ceil(math.log2(frame_length * 2))
+
+    # Under a memory budget (bytes), shorter chunks are used : fewer valid lags per FFT, but a smaller
+    # working set (chunk, template spectrums, correlations). A chunk still yields at least a quarter
+    # of the template length in lags. A budget of 0 (already over it) gets the smallest chunk.
+    if memory_budget is not None:
+        while fft_length // 2 >= frame_length * 5 // 4 and fft_length * (n_templates + 1) * FFT_BYTES_PER_SAMPLE > memory_budget:
+            fft_length //= 2
+
+    return fft_length
+
+
+def get_cumulative_sums(chunk):
+    chunk = chunk.astype(np.float64)
+    return np.concatenate(([0.], np.cumsum(chunk))), np.concatenate(([0.], np.cumsum(chunk * chunk)))
+
+
+def get_window_energy(cumulative_sums, frame_length, n_lags):
+    # Sum and squared sum of every frame_length window, from cumulative sums over the chunk
+    cumsum, cumsum_sq = cumulative_sums
+
+    window_sum = cumsum[frame_length:frame_length + n_lags] - cumsum[:n_lags]
+    window_sum_sq = cumsum_sq[frame_length:frame_length + n_lags] - cumsum_sq[:n_lags]
+
+    return np.maximum(window_sum_sq - window_sum * window_sum / frame_length, 0.)
+
+
+def iter_correlation_multi(source_stream, template_sounds, fft_length=None, normalized=False):
+    # Overlap-save: every chunk of fft_length samples gives fft_length - frame_length + 1 valid lags,
+    # the last frame_length - 1 samples are kept for the next chunk. The chunk spectrum is computed
+    # once and shared by all the templates, frame_length being the longest one.
+    frame_lengths = [len(template_sound) for template_sound in template_sounds]
+    frame_length = max(frame_lengths)
+
+    if fft_length is None:
+        fft_length = get_fft_length(frame_length)
+
+    if normalized:
+        template_sounds = [template_sound - np.mean(template_sound) for template_sound in template_sounds]
+        template_norms = [np.sqrt(np.sum(template_sound.astype(np.float64) ** 2)) for template_sound in template_sounds]
+
+    step = fft_length - frame_length + 1
+    template_ffts = [np.conj(np.fft.rfft(template_sound, fft_length)) for template_sound in template_sounds]
+
+    def correlate_chunk(chunk, n_lags_list):
+        # Silent chunks (e.g. muted parts of a VOD filled with zeros) can't match anything
+        if not np.any(chunk):
+            return [np.zeros(max(n_lags, 0)) for n_lags in n_lags_list]
+
+        chunk_fft = np.fft.rfft(chunk, fft_length)
+
+        if normalized:
+            cumulative_sums = get_cumulative_sums(chunk)
+
+        corrs = []
+
+        for i, n_lags in enumerate(n_lags_list):
+            if n_lags <= 0:
+                corrs.append(np.zeros(0))
+                continue
+
+            corr = np.fft.irfft(chunk_fft * template_ffts[i], fft_length)[:n_lags]
+
+            if normalized:
+                # Windows next to silence get an energy at the rounding error of the cumulative sums,
+                # which would blow their correlation up : they are scored 0 like silent windows
+                window_energy = get_window_energy(cumulative_sums, frame_lengths[i], n_lags)
+                is_audible = window_energy > max(cumulative_sums[1][-1] * 1e-9, 1e-18)
+                norm = template_norms[i] * np.sqrt(window_energy)
+                corr = np.where(is_audible, corr / np.maximum(norm, 1e-9), 0.)
+                corr = np.clip(corr, -1., 1.)
+
+            corrs.append(corr)
+
+        return corrs
+
+    buffer = np.zeros(0, dtype=np.float32)
+    position = 0
+
+    for block in source_stream:
+        buffer = np.concatenate((buffer, block))
+
+        while buffer.shape[0] >= fft_length:
+            yield position, correlate_chunk(buffer[:fft_length], [step] * len(template_sounds))
+
+            buffer = buffer[step:]
+            position += step
+
+    if buffer.shape[0] >= min(frame_lengths):
+        yield position, correlate_chunk(buffer, [buffer.shape[0] - template_length + 1 for template_length in frame_lengths])
+
+
+def iter_correlation(source_stream, template_sound, fft_length=None, normalized=False):
+    for position, corrs in iter_correlation_multi(source_stream, [template_sound], fft_length, normalized):
+        yield position, corrs[0]
+
+
+def find_audio_sample_fft(source_path, template_path, normalized=False):
+    template_sound = load_template(template_path)
+
+    source_rate, source_length = get_source_info(source_path)
+
+    frame_length = len(template_sound)
+    fft_length = get_fft_length(frame_length)
+
+    source_stream = stream_source(source_path, block_length=fft_length - frame_length + 1)
+
+    max_value = 0
+    max_time = -1
+
+    for position, corr in iter_correlation(source_stream, template_sound, fft_length, normalized=normalized):
+        corr = np.abs(corr)
+        i_max = np.argmax(corr)
+
+        if max_value < corr[i_max]:
+            max_time = (position + i_max) / source_rate
+            max_value = corr[i_max]
+
+    return max_time, max_value
+
+
+def decimate_stream(source_stream, factor):
+    # Anti-aliasing low-pass (same IIR as scipy.signal.decimate) then one sample out of factor,
+    # the filter state and the sampling phase are carried from one block to the next
+    if factor == 1:
+        yield from source_stream
+        return
+
+    sos = scipy.signal.cheby1(8, 0.05, 0.8 / factor, output="sos")
+    zi = np.zeros((sos.shape[0], 2))
+
+    position = 0
+
+    for block in source_stream:
+        filtered_block, zi = scipy.signal.sosfilt(sos, block, zi=zi)
+
+        yield filtered_block[(-position) % factor::factor].astype(np.float32)
+
+        position += block.shape[0]
+
+
+def get_coarse_source(source_path, factor, block_length=1 << 20):
+    # The decimated reference is written once next to it, every later coarse pass over the same
+    # reference (other templates, growing chunks, rescans) only reads factor times fewer samples.
+    # Its name carries the inode, size and mtime of the reference : another file written or hard
+    # linked (media cache) at the same path gets its own. Decimated on the fly when it can't be written.
+    source_stat = os.stat(source_path)
+    coarse_prefix = f"{os.path.splitext(source_path)[0]}.coarse{factor}_"
+    coarse_path = f"{coarse_prefix}{source_stat.st_ino}_{source_stat.st_size}_{source_stat.st_mtime_ns}.pcm"
+
+    if os.path.exists(coarse_path):
+        return stream_source(coarse_path, block_length=block_length // factor)
+
+    source_rate, source_length = get_source_info(source_path)
+    tmp_path = f"{coarse_path}.tmp{os.getpid()}"
+
+    try:
+        write_pcm(tmp_path, decimate_stream(stream_source(source_path, block_length=block_length), factor), source_rate // factor)
+        os.replace(tmp_path, coarse_path)
+
+        # Copies of the previous files at this path
+        for stale_path in glob.glob(f"{glob.escape(coarse_prefix)}*.pcm"):
+            if stale_path != coarse_path:
+                os.remove(stale_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        return decimate_stream(stream_source(source_path, block_length=block_length), factor)
+
+    return stream_source(coarse_path, block_length=block_length // factor)
+
+
+def update_peaks(peaks, position, corr, n_peaks, min_distance):
+    corr = np.abs(corr)
+
+    for i in range(n_peaks):
+        i_max = np.argmax(corr)
+        peaks.append((corr[i_max], position + i_max))
+        corr[max(0, i_max - min_distance):i_max + min_distance] = 0
+
+    peaks.sort(reverse=True)
+
+    kept_peaks = []
+
+    for value, lag in peaks:
+        if all(abs(lag - kept_lag) >= min_distance for kept_value, kept_lag in kept_peaks):
+            kept_peaks.append((value, lag))
+
+    peaks[:] = kept_peaks[:n_peaks]
+
+
+def find_audio_samples(source_path, template_paths, coarse_rate=1000, n_candidates=5, min_peak_ratio=1.3, memory_budget=None):
+    template_sounds = [load_template(template_path) for template_path in template_paths]
+
+    source_rate, source_length = get_source_info(source_path)
+    factor = max(1, source_rate // coarse_rate) if coarse_rate else 1
+
+    # Coarse pass over the whole reference at about coarse_rate, all the templates at once
+    coarse_templates = [next(decimate_stream([template_sound], factor)) for template_sound in template_sounds]
+    coarse_frame_length = max(len(coarse_template) for coarse_template in coarse_templates)
+    coarse_fft_length = get_fft_length(coarse_frame_length, len(coarse_templates), memory_budget)
+
+    if factor == 1:
+        coarse_stream = stream_source(source_path, block_length=coarse_fft_length - coarse_frame_length + 1)
+    else:
+        coarse_stream = get_coarse_source(source_path, factor, (coarse_fft_length - coarse_frame_length + 1) * factor)
+
+    peaks_list = [[] for template_sound in template_sounds]
+
+    for position, corrs in iter_correlation_multi(coarse_stream, coarse_templates, coarse_fft_length, normalized=True):
+        for i, corr in enumerate(corrs):
+            if corr.shape[0] > 0:
+                update_peaks(peaks_list[i], position, corr, n_candidates, len(coarse_templates[i]) // 2)
+
+    if factor == 1:
+        return [(peaks[0][1] / source_rate, peaks[0][0]) if peaks else (-1, 0) for peaks in peaks_list]
+
+    # Fine pass at full rate, only around the coarse candidates
+    margin = 4 * factor + source_rate // 10
+
+    results = []
+    rescan_ids = []
+
+    for i, (template_sound, peaks) in enumerate(zip(template_sounds, peaks_list)):
+        refined_results = sorted((refine_audio_sample(source_path, template_sound, source_rate, coarse_lag * factor / source_rate, margin / source_rate) for coarse_value, coarse_lag in peaks), key=lambda refined_result: refined_result[1], reverse=True)
+
+        results.append(refined_results[0] if refined_results else (-1, 0))
+
+        # The coarse pass only sees what is below coarse_rate / 2, and its scores can't be compared with
+        # full rate ones (noise is mostly above that band). The refined candidates are compared with each
+        # other instead : the right window stands well above the others, when none does it probably wasn't
+        # among the candidates and the template is searched again at a higher rate.
+        if len(refined_results) > 1 and refined_results[0][1] < min_peak_ratio * refined_results[1][1]:
+            rescan_ids.append(i)
+
+    if rescan_ids:
+        # Searched again at twice the coarse rate while that still decimates by 4 or more, then at full rate
+        rescan_rate = coarse_rate * 2 if source_rate // (coarse_rate * 2) >= 4 else None
+        rescan_results = find_audio_samples(source_path, [template_paths[i] for i in rescan_ids], coarse_rate=rescan_rate, n_candidates=n_candidates, min_peak_ratio=min_peak_ratio, memory_budget=memory_budget)
+
+        for i, rescan_result in zip(rescan_ids, rescan_results):
+            results[i] = rescan_result
+
+    return results
+
+
+def find_audio_samples_in_stream(source_stream, source_rate, template_paths, normalized=True, early_exit_confidence=None, memory_budget=None):
+    # Single full rate pass over blocks that can only be read once (e.g. an ffmpeg pipe).
+    # With early_exit_confidence, reading stops once every template has a peak above it : one more
+    # chunk is still correlated so that a peak on a chunk boundary gets its neighbours.
+    template_sounds = [load_template(template_path) for template_path in template_paths]
+
+    results = [(-1, 0)] * len(template_sounds)
+    n_chunks_left = None
+
+    fft_length = get_fft_length(max(len(template_sound) for template_sound in template_sounds), len(template_sounds), memory_budget)
+    correlation_stream = iter_correlation_multi(source_stream, template_sounds, fft_length, normalized=normalized)
+
+    for position, corrs in correlation_stream:
+        for i, corr in enumerate(corrs):
+            if corr.shape[0] == 0:
+                continue
+
+            corr = np.abs(corr)
+            i_max = np.argmax(corr)
+
+            if results[i][1] < corr[i_max]:
+                results[i] = ((position + i_max) / source_rate, corr[i_max])
+
+        if n_chunks_left is not None:
+            n_chunks_left -= 1
+        elif early_exit_confidence and all(result[1] >= early_exit_confidence for result in results):
+            n_chunks_left = 1
+
+        if n_chunks_left == 0:
+            # Closing the source also stops its download (see medias.stream_audio)
+            correlation_stream.close()
+
+            if hasattr(source_stream, "close"):
+                source_stream.close()
+
+            break
+
+    return results
+
+
+def find_audio_sample_pyramid(source_path, template_path, coarse_rate=1000, n_candidates=5, min_peak_ratio=1.3, memory_budget=None):
+    return find_audio_samples(source_path, [template_path], coarse_rate, n_candidates, min_peak_ratio, memory_budget)[0]
+
+
+def find_audio_sample_peaks(source_path, template_path, n_peaks=5, normalized=True, memory_budget=None):
+    template_sound = load_template(template_path)
+
+    source_rate, source_length = get_source_info(source_path)
+
+    frame_length = len(template_sound)
+    fft_length = get_fft_length(frame_length, memory_budget=memory_budget)
+
+    source_stream = stream_source(source_path, block_length=fft_length - frame_length + 1)
+
+    peaks = []
+
+    # Running statistics of the whole correlation, standing for the sidelobes around the peaks
+    corr_count = 0
+    corr_sum = 0.
+    corr_sum_sq = 0.
+
+    for position, corr in iter_correlation(source_stream, template_sound, fft_length, normalized=normalized):
+        corr = np.abs(corr)
+
+        corr_count += corr.shape[0]
+        corr_sum += np.sum(corr, dtype=np.float64)
+        corr_sum_sq += np.sum(corr.astype(np.float64) ** 2)
+
+        update_peaks(peaks, position, corr, n_peaks, frame_length // 2)
+
+    if corr_count == 0:
+        return []
+
+    corr_mean = corr_sum / corr_count
+    corr_std = math.sqrt(max(corr_sum_sq / corr_count - corr_mean ** 2, 0.))
+
+    # Peak-to-sidelobe ratio : how many standard deviations the peak stands above the rest
+    return [(lag / source_rate, value, (value - corr_mean) / corr_std if corr_std > 0 else 0.) for value, lag in peaks]
+
+
+def iter_onset_strength(sound_stream, rate, n_fft=512, hop_length=128, n_mels=64):
+    # Spectral flux of the log-mel spectrogram, the last frame of each block is kept to diff the next one
+    mel_basis = librosa.filters.mel(sr=rate, n_fft=n_fft, n_mels=n_mels)
+    previous_frame = None
+
+    for block in sound_stream:
+        if block.shape[0] < n_fft:
+            continue
+
+        spectrogram = np.abs(librosa.stft(block, n_fft=n_fft, hop_length=hop_length, center=False)) ** 2
+        log_mel_spectrogram = librosa.power_to_db(mel_basis @ spectrogram, ref=1.0)
+
+        if previous_frame is not None:
+            log_mel_spectrogram = np.concatenate((previous_frame, log_mel_spectrogram), axis=1)
+        else:
+            log_mel_spectrogram = np.concatenate((log_mel_spectrogram[:, :1], log_mel_spectrogram), axis=1)
+
+        previous_frame = log_mel_spectrogram[:, -1:]
+
+        yield np.mean(np.maximum(0., np.diff(log_mel_spectrogram, axis=1)), axis=0).astype(np.float32)
+
+
+def refine_audio_sample(source_path, template_sound, source_rate, approx_time, margin):
+    window_start = max(0, round((approx_time - margin) * source_rate))
+    window_sound = load_source_range(source_path, window_start, round((approx_time + margin) * source_rate) + len(template_sound))
+
+    max_value = 0
+    max_time = -1
+
+    # One FFT as long as the window : only 2 * margin lags are needed, not as many as the template length
+    fft_length = 2 ** math.ceil(math.log2(max(len(window_sound), len(template_sound))))
+
+    for position, corr in iter_correlation([window_sound], template_sound, fft_length, normalized=True):
+        corr = np.abs(corr)
+        i_max = np.argmax(corr)
+
+        if max_value < corr[i_max]:
+            max_time = (window_start + position + i_max) / source_rate
+            max_value = corr[i_max]
+
+    return max_time, max_value
+
+
+def find_audio_sample_features(source_path, template_path, n_fft=512, hop_length=128, n_candidates=3, refine_margin=1.0, memory_budget=None):
+    source_rate, source_length = get_source_info(source_path)
+
+    template_sound = load_template(template_path, rate=source_rate)
+
+    template_features = next(iter_onset_strength([template_sound], source_rate, n_fft, hop_length))
+    frame_length = len(template_features)
+    fft_length = get_fft_length(frame_length, memory_budget=memory_budget)
+
+    # Frames don't overlap between blocks : each block holds exactly block_length frames. Without a
+    # memory budget, blocks of at least 8192 frames keep the STFT calls few.
+    block_length = fft_length - frame_length + 1
+
+    if memory_budget is None:
+        block_length = max(block_length, 8192)
+
+    source_stream = stream_source(source_path,
+                                  block_length=block_length,
+                                  frame_length=n_fft,
+                                  hop_length=hop_length)
+
+    peaks = []
+
+    for position, corr in iter_correlation(iter_onset_strength(source_stream, source_rate, n_fft, hop_length), template_features, fft_length, normalized=True):
+        update_peaks(peaks, position, corr, n_candidates, frame_length // 2)
+
+    # Feature frames are hop_length samples apart, the exact position is found back on the PCM
+    max_value = 0
+    max_time = -1
+
+    for feature_value, feature_lag in peaks:
+        refined_time, refined_value = refine_audio_sample(source_path, template_sound, source_rate, feature_lag * hop_length / source_rate, refine_margin)
+
+        if max_value < refined_value:
+            max_time = refined_time
+            max_value = refined_value
+
+    return max_time, max_value
+
+
+NATIVE_THREADS_ENV_VARS = ["OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS"]
+
+
+@contextlib.contextmanager
+def limit_native_threads(n_threads=1):
+    # Spawned workers read these when they import numpy, so N workers don't each start a full BLAS/OpenMP pool
+    previous_values = {name: os.environ.get(name) for name in NATIVE_THREADS_ENV_VARS}
+
+    for name in NATIVE_THREADS_ENV_VARS:
+        os.environ[name] = str(n_threads)
+
+    try:
+        yield
+    finally:
+        for name, value in previous_values.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def search_shard(source_path, template_sound, start, stop, normalized, memory_budget=None):
+    frame_length = len(template_sound)
+    fft_length = get_fft_length(frame_length, memory_budget=memory_budget)
+
+    source_stream = stream_source(source_path, block_length=fft_length - frame_length + 1, start=start, stop=stop)
+
+    max_value = 0
+    max_lag = -1
+
+    for position, corr in iter_correlation(source_stream, template_sound, fft_length, normalized=normalized):
+        corr = np.abs(corr)
+        i_max = np.argmax(corr)
+
+        if max_value < corr[i_max]:
+            max_lag = start + position + i_max
+            max_value = corr[i_max]
+
+    return max_lag, max_value
+
+
+def find_audio_sample_parallel(source_path, template_path, workers=None, normalized=True, memory_budget=None):
+    template_sound = load_template(template_path)
+
+    source_rate, source_length = get_source_info(source_path)
+
+    if not workers:
+        workers = os.cpu_count()
+
+    frame_length = len(template_sound)
+    n_lags = source_length - frame_length + 1
+
+    if n_lags <= 0:
+        return -1, 0
+
+    # Each shard owns a range of lags and reads frame_length - 1 more samples, so no match straddles two shards
+    shard_lags = math.ceil(n_lags / workers)
+    shards = [(start, min(start + shard_lags, n_lags) + frame_length - 1) for start in range(0, n_lags, shard_lags)]
+
+    with limit_native_threads():
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn")) as executor:
+            results = list(executor.map(search_shard,
+                                        [source_path] * len(shards),
+                                        [template_sound] * len(shards),
+                                        [start for start, stop in shards],
+                                        [stop for start, stop in shards],
+                                        [normalized] * len(shards),
+                                        [memory_budget // len(shards) if memory_budget is not None else None] * len(shards)))
+
+    max_lag, max_value = max(results, key=lambda r: r[1])
+
+    if max_lag < 0:
+        return -1, 0
+
+    return max_lag / source_rate, max_value
+
+
+# Matchers sharing the same signature : (source path, template path or samples) -> (time in seconds, score).
+# detection.fingerprint adds its own when imported, detection.calibration picks the fastest one.
+MATCHERS = {
+    "loop": find_audio_sample,
+    "fft": functools.partial(find_audio_sample_fft, normalized=True),
+    "pyramid": find_audio_sample_pyramid,
+    "feature": find_audio_sample_features,
+    "parallel": find_audio_sample_parallel,
+}
+
+
 if __name__ == "__main__":
     t_start = time.time()
 
-    found_time, found_value = find_audio_sample("C:/Users/f.clement/Desktop/vod_cutter/temp_ref_audio.wav",
+    found_time, found_value = find_audio_sample_fft("C:/Users/f.clement/Desktop/vod_cutter/temp_ref_audio.wav",
                                                 "C:/Users/f.clement/Desktop/vod_cutter/temp_prm_audio.wav")
 
     t_end = time.time()
@@ -0,0 +1,56 @@
+import numpy as np
+
+
+# Piecewise-constant offset map of an edited permanent upload : each point is (time in the permanent
+# video, offset to the reference, confidence), and a new segment starts when at least min_points
+# consecutive points agree on an offset that differs from the current one by more than tolerance.
+
+def fit_offset_map(points, duration, tolerance=1.0, min_confidence=0.5, min_points=2):
+    points = sorted(p for p in points if p[2] >= min_confidence)
+
+    if not points:
+        return []
+
+    segments = [[points[0]]]
+    pending_points = []
+
+    for point in points[1:]:
+        segment_offset = np.median([p[1] for p in segments[-1]])
+
+        if abs(point[1] - segment_offset) <= tolerance:
+            # Back on the current offset : whatever was pending was an outlier
+            segments[-1].append(point)
+            pending_points = []
+            continue
+
+        if pending_points and abs(point[1] - np.median([p[1] for p in pending_points])) > tolerance:
+            pending_points = []
+
+        pending_points.append(point)
+
+        if len(pending_points) >= min_points:
+            segments.append(pending_points)
+            pending_points = []
+
+    # Only the first segment can start from a single point : a leading outlier is ignored like any other.
+    # A lone point has nothing to disagree with though.
+    segments = [segment for segment in segments if len(segment) >= min(min_points, len(points))]
+
+    if not segments:
+        return []
+
+    offset_map = []
+
+    for i, segment in enumerate(segments):
+        # Breakpoints sit halfway between the last point of a segment and the first one of the next
+        start = 0 if i == 0 else (segments[i - 1][-1][0] + segment[0][0]) / 2
+        end = duration if i == len(segments) - 1 else (segment[-1][0] + segments[i + 1][0][0]) / 2
+
+        offset_map.append({
+            "start": start,
+            "end": end,
+            "offset": float(np.median([p[1] for p in segment])),
+            "points": len(segment),
+        })
+
+    return offset_map
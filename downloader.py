@@ -1,26 +1,39 @@
 import os
 import re
+import math
 import time
 import json
+import shutil
 import datetime
+import tempfile
 import subprocess
 import pprint
+import concurrent.futures
+
+import numpy as np
 
 import youtube_dl
 import streamlink
 
 import utils.time
 import detection.sound
+import detection.fingerprint
+import detection.timeline
+import detection.selection
+import detection.calibration
 
 import config
 
 from log import Log
+from log.memory import track_memory, get_memory_headroom, get_rss, format_size
 
 from interface.twitch import TwitchInterface
-from medias import get_video_duration, download_audio, download_audio_ytdl
+from medias import get_video_duration, is_video_duration_final, download_audio, download_audio_ytdl, stream_audio, load_audio, get_muted_ranges, stream_audio_unmuted, download_audio_pcm_parallel
 from medias.parsers import get_video_service_id
+from medias.cache import MediaCache
 
 from metadatas import get_metadata_filename
+from metadatas.retrieve import retrieve_metadatas
 from metadatas.write import write_metadatas, export_metadatas
 
 
@@ -28,67 +41,591 @@ from metadatas.write import write_metadatas, export_metadatas
 # https://ostechnix.com/download-a-portion-of-youtube-video-with-youtube-dl-and-ffmpeg/
 
 
-def find_offset(ref_video_url, prm_video_url_list, prm_video_pos=0.5):
-    prm_video_start_time_list = []
+def get_media_cache():
+    if not config.MEDIA_CACHE_SIZE:
+        return None
 
-    for prm_video_url in prm_video_url_list:
-        prm_video_start_time = prm_video_pos * get_video_duration(prm_video_url)
-        prm_video_start_time_list.append(prm_video_start_time)
-    
-    download_audio(ref_video_url, "temp_ref_audio.wav", rate=8000)
+    return MediaCache(config.MEDIA_CACHE_PATH, config.MEDIA_CACHE_SIZE * 2 ** 20)
 
-    offset_list = []
 
-    for i, prm_video_url in enumerate(prm_video_url_list):
-        log = Log()
+def download_ref_audio(ref_video_url, ref_audio_path, rate, muted_ranges=None):
+    if not download_audio_pcm_parallel(ref_video_url, ref_audio_path, rate, config.DOWNLOAD_WORKERS, muted_ranges, cache=get_media_cache()):
+        raise Exception(f"<!!> Can't download the audio of reference video {ref_video_url}")
 
-        prm_video_start_time_str = utils.time.format_time(prm_video_start_time_list[i])
 
-        log.add(f"Starting to download a chunk of 00:01:00 of {prm_video_url} at {prm_video_start_time_str}")
+def log_fingerprint_index_size(log_list, index):
+    # The index is searched whole : the one stage MEMORY_BUDGET can't bound, only the build around it is
+    index_size = detection.fingerprint.get_index_size(index)
+    memory_headroom = get_memory_headroom(config.MEMORY_BUDGET)
 
-        download_start_time = time.time()
+    for log in log_list:
+        if memory_headroom is not None and index_size > memory_headroom:
+            log.add(f"Fingerprint index of {format_size(index_size)} held in memory, over the {format_size(memory_headroom)} left in the memory budget", prefix="!")
+        else:
+            log.add(f"Fingerprint index of {format_size(index_size)} held in memory")
+
+
+def get_fingerprint_index(ref_video_url, temp_dir, muted_ranges=None, log_list=()):
+    ref_video_id, ref_video_service = get_video_service_id(ref_video_url)
+    index_path = detection.fingerprint.get_index_path(config.FINGERPRINTS_PATH, ref_video_id, ref_video_service)
+
+    if os.path.exists(index_path):
+        index = detection.fingerprint.load_index(index_path)
+        log_fingerprint_index_size(log_list, index)
+        return index
+
+    # Always indexed at 8 kHz, the rate the landmarks are tuned for : templates are resampled to it
+    ref_audio_path = os.path.join(temp_dir, "ref_audio.pcm")
+    download_ref_audio(ref_video_url, ref_audio_path, 8000, muted_ranges)
+
+    index = detection.fingerprint.build_index(ref_audio_path)
+
+    # The index of a VOD still being recorded would miss its end once it's over
+    if is_video_duration_final(ref_video_url):
+        detection.fingerprint.save_index(index_path, index)
+
+    log_fingerprint_index_size(log_list, index)
+
+    return index
+
+
+def refine_fingerprint_match(ref_video_url, prm_audio, fingerprint_result, temp_dir, rate=8000, margin=1):
+    # The landmark votes place the chunk to a hop (16ms) and score it on their own scale, it is correlated
+    # again around that spot on a short window of the reference to get the same confidence as the other backends
+    detected_sample_time, votes_share = fingerprint_result
+
+    if detected_sample_time < 0:
+        return fingerprint_result
+
+    template_sound = detection.sound.load_template(prm_audio, rate=rate)
+
+    window_start = max(0, math.floor(detected_sample_time - margin))
+    window_duration = math.ceil(len(template_sound) / rate + 2 * margin)
+
+    ref_window_audio_path = os.path.join(temp_dir, "ref_fingerprint_audio.wav")
+    download_audio(ref_video_url, ref_window_audio_path, start_time=window_start, duration=window_duration, rate=rate, cache=get_media_cache())
+
+    refined_time, confidence = detection.sound.refine_audio_sample(ref_window_audio_path, template_sound, rate, detected_sample_time - window_start, margin)
+
+    if refined_time < 0:
+        return -1, 0
+
+    return window_start + refined_time, confidence
+
+
+def log_muted_ranges(log_list, muted_ranges):
+    if not muted_ranges:
+        return
+
+    muted_ranges_str = ", ".join(f"{utils.time.format_time(muted_start)}-{utils.time.format_time(muted_end)}" for muted_start, muted_end in muted_ranges)
+
+    for log in log_list:
+        log.add(f"Masked muted ranges of the reference : {muted_ranges_str}")
+
+
+def download_prm_audio(prm_video_url, output_path, start_time, duration, log, rate=8000):
+    try:
+        download_audio(prm_video_url, output_path, start_time=start_time, duration=duration, rate=rate, cache=get_media_cache())
+    except streamlink.exceptions.PluginError as e:
+        log.add(f"Can't download permanent video {prm_video_url} using streamlink. Retring using youtube-dl.", prefix="!")
+        download_audio_ytdl(prm_video_url, output_path, start_time=start_time, duration=duration, rate=rate, cache=get_media_cache())
+
+
+def load_search_preset(preset_path):
+    with open(preset_path, "r") as fp:
+        return json.load(fp)
+
+
+def get_search_workers():
+    workers = config.SEARCH_WORKERS or os.cpu_count()
+    memory_headroom = get_memory_headroom(config.MEMORY_BUDGET)
+
+    # Every spawned worker imports the same modules as this process, so costs at least as much
+    if memory_headroom is not None and get_rss():
+        workers = max(1, min(workers, memory_headroom // get_rss()))
+
+    return workers
+
+
+def get_prm_audio(prm_video_url, prm_audio_path, start_time, duration, streaming, log, rate=8000):
+    if streaming:
+        return load_prm_audio(prm_video_url, start_time, duration, log, rate)
+
+    download_prm_audio(prm_video_url, prm_audio_path, start_time, duration, log, rate)
+    return prm_audio_path
+
+
+def load_prm_audio(prm_video_url, start_time, duration, log, rate=8000):
+    try:
+        return load_audio(prm_video_url, start_time=start_time, duration=duration, rate=rate)
+    except streamlink.exceptions.PluginError as e:
+        log.add(f"Can't stream permanent video {prm_video_url} using streamlink. Retring using youtube-dl.", prefix="!")
+        return load_audio(prm_video_url, start_time=start_time, duration=duration, rate=rate, use_ytdl=True)
+
+
+def select_prm_start_time(prm_video_url, prm_video_duration, center_time, template_duration, selection_duration, selection_probes, log):
+    # A few short probes spread over the span around center_time are decoded to a low-rate envelope,
+    # then the template is cut where the audio is the most distinctive. The whole span would cost as
+    # much to fetch as the search itself, the probes together are about the size of the default chunk.
+    span_start = max(0, min(center_time - selection_duration / 2, prm_video_duration - selection_duration))
+    span_duration = min(selection_duration, prm_video_duration - span_start)
+
+    probe_duration = min(template_duration * 4 / 3, span_duration)
+
+    best_start, best_score = center_time, 0
+
+    for k in range(selection_probes):
+        probe_start = span_start + (span_duration - probe_duration) * (k + 0.5) / selection_probes
 
         try:
-            download_audio(prm_video_url, "temp_prm_audio.wav", start_time=prm_video_start_time_str, duration="00:01:00", rate=8000)
+            loudness, entropy = detection.selection.get_envelope(stream_audio(prm_video_url, start_time=probe_start, duration=probe_duration, rate=4000), 4000)
         except streamlink.exceptions.PluginError as e:
-            log.add(f"Can't download permanent video {prm_video_url} using streamlink. Retring using youtube-dl.", prefix="!")
-            download_audio_ytdl(prm_video_url, "temp_prm_audio.wav", start_time=prm_video_start_time_str, duration="00:01:00", rate=8000)
+            log.add(f"Can't stream permanent video {prm_video_url} using streamlink. Retring using youtube-dl.", prefix="!")
+            loudness, entropy = detection.selection.get_envelope(stream_audio(prm_video_url, start_time=probe_start, duration=probe_duration, rate=4000, use_ytdl=True), 4000)
 
-        download_time = time.time() - download_start_time
-        log.add(f"Downloaded permanent video chunk. Download duration : {utils.time.format_time(download_time)} ({round(download_time, 2)}s)")
+        window_start, window_score = detection.selection.select_template_window(loudness, entropy, template_duration)
 
-        search_start_time = time.time()
+        if window_score > best_score:
+            best_start, best_score = probe_start + window_start, window_score
 
-        detected_sample_time, max_value = detection.sound.find_audio_sample("temp_ref_audio.wav", "temp_prm_audio.wav")
+    log.add(f"Probed {selection_probes} chunks of {round(probe_duration, 2)}s of the permanent video between {utils.time.format_time(span_start)} and {utils.time.format_time(span_start + span_duration)} ({round(selection_probes * probe_duration, 2)}s of audio fetched to select the template)")
 
-        search_time = time.time() - search_start_time
-        log.add(f"Found sample (maybe) in permanent video at {utils.time.format_time(detected_sample_time)}. Search duration : {utils.time.format_time(search_time)} ({round(search_time, 2)}s)")
+    if best_score == 0:
+        log.add(f"No distinctive audio found around {utils.time.format_time(center_time)}, keeping the default chunk", prefix="!")
+        return center_time
 
-        #print(f"Sample for {prm_video_url}, starting at {prm_video_start_time_str} may be found at : {utils.time.format_time(detected_sample_time)} ({round(detected_sample_time, 2)}s)")
-        
-        # WAS time_offset = prm_video_start_time - detected_sample_time
-        time_offset = detected_sample_time - prm_video_start_time
-        offset_list.append(time_offset)
+    log.add(f"Selected the chunk at {utils.time.format_time(best_start)} (score : {round(best_score, 3)})")
+
+    return best_start
+
+
+def get_prior_windows(ref_video_url, prm_video_url_list, prm_video_start_time_list, tolerance, log_list, is_complete_parts=False):
+    # Expected position of each permanent chunk in the reference, when the metadatas tell it
+    ref_video_id, ref_video_service = get_video_service_id(ref_video_url)
+    ref_metadatas = None
+
+    youtube_parts_duration = 0
+    prior_windows = []
+
+    for i, prm_video_url in enumerate(prm_video_url_list):
+        prm_video_id, prm_video_service = get_video_service_id(prm_video_url)
+        prior_window = None
+
+        if prm_video_service == "twitch" and ref_video_service == "twitch":
+            # Co-streams : the gap between the two creation dates
+            try:
+                if ref_metadatas is None:
+                    ref_metadatas = retrieve_metadatas(ref_video_id)
+
+                prm_metadatas = retrieve_metadatas(prm_video_id)
+                created_delay = (prm_metadatas["created_at"] - ref_metadatas["created_at"]).total_seconds()
+
+                prior_window = (prm_video_start_time_list[i] + created_delay, tolerance)
+            except Exception as e:
+                log_list[i].add(f"Can't get a prior window from Twitch metadatas : {e}", prefix="!")
+
+        elif prm_video_service == "youtube" and is_complete_parts:
+            # Parts of a split VOD : only when the caller gives all of them, in playlist order,
+            # otherwise the durations before a part don't add up to its start
+            prior_window = (youtube_parts_duration + prm_video_start_time_list[i], tolerance)
+            youtube_parts_duration += get_video_duration(prm_video_url)
+
+        prior_windows.append(prior_window)
+
+    return prior_windows
+
+
+def search_prior_window(ref_video_url, ref_video_duration, prm_audio, prior_window, min_confidence, log, temp_dir, streaming=False, rate=8000):
+    center, tolerance = prior_window
+
+    template_duration = math.ceil(len(detection.sound.load_template(prm_audio, rate=rate)) / rate)
+
+    while True:
+        window_start = min(max(0, math.floor(center - tolerance)), max(0, math.floor(ref_video_duration) - template_duration))
+        window_end = min(math.ceil(ref_video_duration), math.ceil(center + tolerance) + template_duration)
+
+        if window_start == 0 and window_end >= ref_video_duration:
+            # As wide as the whole reference, the full search will do
+            return None
+
+        log.add(f"Searching prior window of the reference between {utils.time.format_time(window_start)} and {utils.time.format_time(window_end)}")
+
+        if streaming:
+            ref_window_stream = stream_audio(ref_video_url, start_time=window_start, duration=window_end - window_start, rate=rate)
+            detected_sample_time, confidence = detection.sound.find_audio_samples_in_stream(ref_window_stream, rate, [prm_audio])[0]
+        else:
+            ref_window_audio_path = os.path.join(temp_dir, "ref_window_audio.wav")
+            download_audio(ref_video_url, ref_window_audio_path, start_time=window_start, duration=window_end - window_start, rate=rate, cache=get_media_cache())
+            detected_sample_time, confidence = detection.sound.find_audio_samples(ref_window_audio_path, [prm_audio])[0]
+
+        if detected_sample_time >= 0 and confidence >= min_confidence:
+            return window_start + detected_sample_time, confidence
+
+        log.add(f"Low confidence in prior window ({round(confidence, 3)}), widening it", prefix="!")
+        tolerance *= 4
+
+
+def verify_offset(ref_video_url, prm_video_url, prm_video_duration, time_offset, verify_pos, min_confidence, log, temp_dir, chunk_duration=10, margin=2, tolerance=0.5, rate=8000):
+    # Correlates a second short chunk only around the position predicted by time_offset
+    prm_chunk_start_time = math.floor(verify_pos * prm_video_duration)
+    predicted_time = prm_chunk_start_time + time_offset
+    window_start = max(0, math.floor(predicted_time - margin))
+
+    prm_verify_audio_path = os.path.join(temp_dir, "prm_verify_audio.wav")
+    ref_verify_audio_path = os.path.join(temp_dir, "ref_verify_audio.wav")
+
+    download_prm_audio(prm_video_url, prm_verify_audio_path, prm_chunk_start_time, chunk_duration, log, rate)
+    download_audio(ref_video_url, ref_verify_audio_path, start_time=window_start, duration=chunk_duration + 2 * margin, rate=rate, cache=get_media_cache())
+
+    detected_sample_time, confidence = detection.sound.find_audio_sample_fft(ref_verify_audio_path, prm_verify_audio_path, normalized=True)
+    drift = window_start + detected_sample_time - predicted_time
+
+    is_verified = detected_sample_time >= 0 and abs(drift) <= tolerance and confidence >= min_confidence
+
+    log.add(f"Verification at {round(verify_pos * 100)}% : {'OK' if is_verified else 'FAILED'} (drift : {round(drift, 3)}s, confidence : {round(confidence, 3)})", prefix="i" if is_verified else "!")
+
+    return is_verified
+
+
+def find_offset(ref_video_url, prm_video_url_list, prm_video_pos=0.5, backend="pcm", prior_windows=None, derive_prior_windows=True, is_complete_parts=False, prior_tolerance=300, min_confidence=0.5, verify_positions=None, n_peaks=5, streaming=False, early_exit_confidence=None, select_template=False, template_duration=None, selection_duration=600, selection_probes=3, template_lengths=None, rate=8000, preset=None):
+    # Preset written by scripts.tune_detection : backend, rate, template length and matcher parameters
+    matcher_params = {}
+
+    if preset is not None:
+        if isinstance(preset, str):
+            preset = load_search_preset(preset)
+
+        backend = preset.get("backend", backend)
+        rate = preset.get("rate", rate)
+        template_duration = preset.get("template_duration", template_duration)
+        matcher_params = preset.get("params", {})
+
+    # Its scores aren't normalized, no confidence threshold of find_offset would mean anything
+    if backend == "loop":
+        raise Exception("<!!> The loop matcher can't be used by find_offset, its scores aren't normalized")
+
+    if template_duration is None:
+        template_duration = 15 if select_template else 60
+
+    # Growing template lengths (e.g. (8, 16, 32, 60)), the next one is only tried while the confidence stays below min_confidence
+    if template_lengths is None:
+        template_lengths = [template_duration]
+
+    prm_video_start_time_list = []
+    log_list = []
+
+    # Files of this job only, so jobs can run side by side in the same directory. What is worth keeping
+    # between jobs goes to the media cache.
+    temp_dir = tempfile.mkdtemp(prefix="vod_cutter_")
+
+    try:
+        for prm_video_url in prm_video_url_list:
+            log = Log()
+            log_list.append(log)
+
+            prm_video_duration = get_video_duration(prm_video_url)
+            prm_video_start_time = prm_video_pos * prm_video_duration
+
+            if select_template:
+                prm_video_start_time = select_prm_start_time(prm_video_url, prm_video_duration, prm_video_start_time, template_duration, selection_duration, selection_probes, log)
+
+            # Chunks are cut on whole seconds
+            prm_video_start_time_list.append(math.floor(prm_video_start_time))
+
+        # Paths of the downloaded chunks, or their samples when streaming
+        prm_audio_list = []
+        template_duration_str = utils.time.format_time(template_lengths[0])
+
+        with track_memory(log_list, "download", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+            for i, prm_video_url in enumerate(prm_video_url_list):
+                log = log_list[i]
+
+                prm_video_start_time_str = utils.time.format_time(prm_video_start_time_list[i])
+
+                log.add(f"Starting to download a chunk of {template_duration_str} of {prm_video_url} at {prm_video_start_time_str}")
+
+                download_start_time = time.time()
+
+                prm_audio_list.append(get_prm_audio(prm_video_url, os.path.join(temp_dir, f"prm_audio_{i}.wav"), prm_video_start_time_str, template_duration_str, streaming, log, rate))
+
+                download_time = time.time() - download_start_time
+                log.add(f"Downloaded permanent video chunk. Download duration : {utils.time.format_time(download_time)} ({round(download_time, 2)}s)")
+
+        search_result_list = [None] * len(prm_video_url_list)
+        search_time_list = [0] * len(prm_video_url_list)
+        template_length_list = [template_lengths[0]] * len(prm_video_url_list)
+
+        # Only a window of the reference is downloaded and searched when we already know roughly where to look
+        if prior_windows is None and derive_prior_windows:
+            prior_windows = get_prior_windows(ref_video_url, prm_video_url_list, prm_video_start_time_list, prior_tolerance, log_list, is_complete_parts)
+
+        if prior_windows and any(prior_windows):
+            ref_video_duration = get_video_duration(ref_video_url)
+
+        if backend == "auto":
+            backend = detection.calibration.choose_matcher(template_lengths[0], get_video_duration(ref_video_url), config.MATCHERS_CALIBRATION_PATH)
+
+            # The pyramid search is the batch one of the pcm backend
+            if backend == "pyramid":
+                backend = "pcm"
+
+            for log in log_list:
+                log.add(f"Search backend chosen from the calibration : {backend}")
+
+        if streaming and early_exit_confidence is None:
+            early_exit_confidence = config.EARLY_EXIT_CONFIDENCE
+
+        # The reference is only streamed when it is searched once : every round of growing chunks would
+        # fetch it again, the early exit never triggers for the chunks below min_confidence
+        is_streamed_search = streaming and backend == "pcm"
+
+        if is_streamed_search and len(template_lengths) > 1:
+            is_streamed_search = False
+
+            for log in log_list:
+                log.add(f"Chunks may grow up to {template_lengths[-1]}s, the reference is decoded once instead of streamed")
+
+        ref_audio_path = None
+        fingerprint_index = None
+        searched_ids = []
+
+        for k, template_length in enumerate(template_lengths):
+            if k > 0:
+                # Chunks that didn't match well enough get longer, only the missing end is downloaded
+                pending_ids = [i for i in searched_ids if search_result_list[i][1] < min_confidence]
+
+                if not pending_ids:
+                    break
+
+                with track_memory([log_list[i] for i in pending_ids], "download", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                    for i in pending_ids:
+                        log = log_list[i]
+                        log.add(f"Confidence of {round(search_result_list[i][1], 3)} with a template of {template_length_list[i]}s, extending it to {template_length}s")
+
+                        extension_start_time_str = utils.time.format_time(prm_video_start_time_list[i] + template_lengths[k - 1])
+                        extension_duration_str = utils.time.format_time(template_length - template_lengths[k - 1])
+
+                        download_start_time = time.time()
+
+                        prm_audio_extension = get_prm_audio(prm_video_url_list[i], os.path.join(temp_dir, f"prm_audio_{i}_{k}.wav"), extension_start_time_str, extension_duration_str, streaming, log, rate)
+                        prm_audio_list[i] = np.concatenate((detection.sound.load_template(prm_audio_list[i], rate=rate), detection.sound.load_template(prm_audio_extension, rate=rate)))
+
+                        download_time = time.time() - download_start_time
+                        log.add(f"Downloaded the chunk extension in {round(download_time, 2)}s")
+
+                        search_result_list[i] = None
+                        template_length_list[i] = template_length
+
+            searched_ids = [i for i, search_result in enumerate(search_result_list) if search_result is None]
+
+            if prior_windows and any(prior_windows):
+                with track_memory([log_list[i] for i in searched_ids], "prior window search", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                    for i in searched_ids:
+                        if prior_windows[i] is None:
+                            continue
+
+                        search_start_time = time.time()
+                        search_result_list[i] = search_prior_window(ref_video_url, ref_video_duration, prm_audio_list[i], prior_windows[i], min_confidence, log_list[i], temp_dir, streaming=streaming, rate=rate)
+                        search_time_list[i] += time.time() - search_start_time
+
+            remaining_ids = [i for i in searched_ids if search_result_list[i] is None]
+
+            if remaining_ids and not is_streamed_search and ref_audio_path is None and fingerprint_index is None:
+                with track_memory([log_list[i] for i in remaining_ids], "decode", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                    # DMCA-muted parts of the reference aren't downloaded, they are left silent and skipped by the search
+                    muted_ranges = get_muted_ranges(ref_video_url)
+                    log_muted_ranges([log_list[i] for i in remaining_ids], muted_ranges)
+
+                    if backend == "fingerprint":
+                        fingerprint_index = get_fingerprint_index(ref_video_url, temp_dir, muted_ranges, [log_list[i] for i in remaining_ids])
+                    else:
+                        # Decoded once, then every search maps the same samples
+                        ref_audio_path = os.path.join(temp_dir, "ref_audio.pcm")
+                        download_ref_audio(ref_video_url, ref_audio_path, rate, muted_ranges)
+
+            if remaining_ids:
+                with track_memory([log_list[i] for i in remaining_ids], "search", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                    if is_streamed_search:
+                        # The reference is correlated while ffmpeg is still decoding it, nothing is written to disk
+                        search_start_time = time.time()
+
+                        muted_ranges = get_muted_ranges(ref_video_url)
+                        log_muted_ranges([log_list[i] for i in remaining_ids], muted_ranges)
+
+                        remaining_results = detection.sound.find_audio_samples_in_stream(stream_audio_unmuted(ref_video_url, rate, muted_ranges), rate, [prm_audio_list[i] for i in remaining_ids], early_exit_confidence=early_exit_confidence, memory_budget=get_memory_headroom(config.MEMORY_BUDGET))
+
+                        is_early_exit = early_exit_confidence and all(confidence >= early_exit_confidence for detected_sample_time, confidence in remaining_results)
+
+                        for i, search_result in zip(remaining_ids, remaining_results):
+                            search_result_list[i] = search_result
+                            search_time_list[i] += time.time() - search_start_time
+
+                            if is_early_exit:
+                                log_list[i].add(f"Every chunk matched above {early_exit_confidence} confidence, stopped streaming the reference early")
+
+                    elif backend == "pcm":
+                        # All the chunks are scored together in a single pass over the reference
+                        search_start_time = time.time()
+
+                        remaining_results = detection.sound.find_audio_samples(ref_audio_path, [prm_audio_list[i] for i in remaining_ids], memory_budget=get_memory_headroom(config.MEMORY_BUDGET), **matcher_params)
+
+                        for i, search_result in zip(remaining_ids, remaining_results):
+                            search_result_list[i] = search_result
+                            search_time_list[i] += time.time() - search_start_time
+                    else:
+                        for i in remaining_ids:
+                            search_start_time = time.time()
+
+                            if backend == "fingerprint":
+                                fingerprint_result = detection.fingerprint.find_audio_sample(fingerprint_index, prm_audio_list[i], template_rate=rate)
+                                search_result_list[i] = refine_fingerprint_match(ref_video_url, prm_audio_list[i], fingerprint_result, temp_dir, rate)
+                            elif backend == "parallel":
+                                search_result_list[i] = detection.sound.find_audio_sample_parallel(ref_audio_path, prm_audio_list[i], workers=get_search_workers(), memory_budget=get_memory_headroom(config.MEMORY_BUDGET))
+                            elif backend == "features":
+                                search_result_list[i] = detection.sound.find_audio_sample_features(ref_audio_path, prm_audio_list[i], memory_budget=get_memory_headroom(config.MEMORY_BUDGET), **matcher_params)
+                            elif backend in detection.sound.MATCHERS:
+                                search_result_list[i] = detection.sound.MATCHERS[backend](ref_audio_path, prm_audio_list[i], **matcher_params)
+                            else:
+                                raise Exception(f"<!!> Unknown search backend {backend}")
+
+                            search_time_list[i] += time.time() - search_start_time
 
         try:
             ref_video_id, ref_video_service = get_video_service_id(ref_video_url)
         except Exception as e:
-            log.add(f"Reference id parse: {e}", prefix="!!")
+            log_list[0].add(f"Reference id parse: {e}", prefix="!!")
             raise e
+
+        offset_list = []
+
+        for i, prm_video_url in enumerate(prm_video_url_list):
+            log = log_list[i]
+
+            detected_sample_time, confidence = search_result_list[i]
+            search_time = search_time_list[i]
+
+            log.add(f"Found sample (maybe) in permanent video at {utils.time.format_time(detected_sample_time)} (confidence : {round(confidence, 3)}). Search duration : {utils.time.format_time(search_time)} ({round(search_time, 2)}s)")
+            log.add(f"Template length : {template_length_list[i]}s")
+
+            #print(f"Sample for {prm_video_url}, starting at {prm_video_start_time_str} may be found at : {utils.time.format_time(detected_sample_time)} ({round(detected_sample_time, 2)}s)")
         
-        prm_video_id, prm_video_service = get_video_service_id(prm_video_url)
-        prm_video_duration = get_video_duration(prm_video_url)
+            # WAS time_offset = prm_video_start_time - detected_sample_time
+            time_offset = detected_sample_time - prm_video_start_time_list[i]
+
+            prm_video_id, prm_video_service = get_video_service_id(prm_video_url)
+            prm_video_duration = get_video_duration(prm_video_url)
+
+            with track_memory([log], "verification", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                if verify_positions:
+                    is_verified = all(verify_offset(ref_video_url, prm_video_url, prm_video_duration, time_offset, verify_pos, min_confidence, log, temp_dir, rate=rate) for verify_pos in verify_positions)
+
+                    if not is_verified and ref_audio_path is not None:
+                        # The best peak didn't hold, the next ones from the full reference are checked the same way
+                        for k, (peak_time, peak_value, peak_psr) in enumerate(detection.sound.find_audio_sample_peaks(ref_audio_path, prm_audio_list[i], n_peaks=n_peaks, memory_budget=get_memory_headroom(config.MEMORY_BUDGET))):
+                            if abs(peak_time - detected_sample_time) < 1:
+                                continue
+
+                            log.add(f"Trying peak #{k + 1} at {utils.time.format_time(peak_time)} (confidence : {round(peak_value, 3)}, PSR : {round(peak_psr, 2)})")
+                            peak_time_offset = peak_time - prm_video_start_time_list[i]
 
-        metadatas = export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_duration, time_offset, log=log)
-        metadatas_filename = get_metadata_filename(config.EXPORT_METADATAS_PATH, metadatas, ref_video_id, prm_video_id)
-        write_metadatas(metadatas_filename, metadatas)
+                            if all(verify_offset(ref_video_url, prm_video_url, prm_video_duration, peak_time_offset, verify_pos, min_confidence, log, temp_dir, rate=rate) for verify_pos in verify_positions):
+                                time_offset = peak_time_offset
+                                is_verified = True
+                                break
 
-        log.write_to_disk(os.path.splitext(metadatas_filename)[0] + ".log")
+                    if not is_verified:
+                        log.add(f"Offset of {prm_video_url} couldn't be verified", prefix="!")
+
+            # The reported match, which is not the first found sample when a later peak got verified
+            log.add(f"Accepted sample in reference video at {utils.time.format_time(prm_video_start_time_list[i] + time_offset)} (time offset : {round(time_offset, 3)}s)")
+
+            if verify_positions:
+                log.add(f"Verification result : {'VERIFIED' if is_verified else 'FAILED'}")
+
+            offset_list.append(time_offset)
+
+            with track_memory([log], "export", config.MEMORY_BUDGET, config.MEMORY_TRACE):
+                metadatas = export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_duration, time_offset, log=log)
+                metadatas_filename = get_metadata_filename(config.EXPORT_METADATAS_PATH, metadatas, ref_video_id, prm_video_id)
+                write_metadatas(metadatas_filename, metadatas)
+
+            log.write_to_disk(os.path.splitext(metadatas_filename)[0] + ".log")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
 
     return offset_list
 
 
 
+def find_offset_map(ref_video_url, prm_video_url, chunk_duration=10, chunk_step=120, download_workers=4, min_confidence=0.5, tolerance=1.0):
+    # Samples short chunks all along the permanent video to follow the cuts of an edited upload
+    log = Log()
+
+    prm_video_duration = get_video_duration(prm_video_url)
+    chunk_start_time_list = list(range(0, math.floor(prm_video_duration) - chunk_duration, chunk_step))
+    temp_dir = tempfile.mkdtemp(prefix="vod_cutter_")
+
+    try:
+        ref_audio_path = os.path.join(temp_dir, "ref_audio.pcm")
+        chunk_path_list = [os.path.join(temp_dir, f"prm_map_audio_{i}.wav") for i in range(len(chunk_start_time_list))]
+
+        log.add(f"Starting to download {len(chunk_start_time_list)} chunks of {chunk_duration}s of {prm_video_url}, every {chunk_step}s")
+
+        download_start_time = time.time()
+
+
+        # The reference and the chunks are fetched at the same time, they are independent ffmpeg processes
+        with concurrent.futures.ThreadPoolExecutor(max_workers=download_workers + 1) as executor:
+            futures = [executor.submit(download_ref_audio, ref_video_url, ref_audio_path, 8000)]
+
+            for chunk_start_time, chunk_path in zip(chunk_start_time_list, chunk_path_list):
+                futures.append(executor.submit(download_prm_audio, prm_video_url, chunk_path, chunk_start_time, chunk_duration, log))
+
+            for future in futures:
+                future.result()
+
+        download_time = time.time() - download_start_time
+        log.add(f"Downloaded reference and permanent video chunks. Download duration : {utils.time.format_time(download_time)} ({round(download_time, 2)}s)")
+
+        search_start_time = time.time()
+
+        search_result_list = detection.sound.find_audio_samples(ref_audio_path, chunk_path_list)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+    search_time = time.time() - search_start_time
+    log.add(f"Searched {len(chunk_path_list)} chunks. Search duration : {utils.time.format_time(search_time)} ({round(search_time, 2)}s)")
+
+    points = []
+
+    for chunk_start_time, (detected_sample_time, confidence) in zip(chunk_start_time_list, search_result_list):
+        points.append((chunk_start_time, detected_sample_time - chunk_start_time, confidence))
+        log.add(f"Chunk at {utils.time.format_time(chunk_start_time)} found at {utils.time.format_time(detected_sample_time)} (offset : {round(detected_sample_time - chunk_start_time, 3)}, confidence : {round(confidence, 3)})")
+
+    offset_map = detection.timeline.fit_offset_map(points, prm_video_duration, tolerance=tolerance, min_confidence=min_confidence)
+
+    if not offset_map:
+        log.add(f"No chunk of {prm_video_url} was found with enough confidence", prefix="!!")
+        return []
+
+    for segment in offset_map:
+        log.add(f"Offset from {utils.time.format_time(segment['start'])} to {utils.time.format_time(segment['end'])} : {round(segment['offset'], 3)} ({segment['points']} chunks)")
+
+    # The longest segment gives the single offset of the legacy metadatas
+    time_offset = max(offset_map, key=lambda segment: segment["end"] - segment["start"])["offset"]
+
+    ref_video_id, ref_video_service = get_video_service_id(ref_video_url)
+    prm_video_id, prm_video_service = get_video_service_id(prm_video_url)
+
+    metadatas = export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_duration, time_offset, log=log, offset_map=offset_map)
+    metadatas_filename = get_metadata_filename(config.EXPORT_METADATAS_PATH, metadatas, ref_video_id, prm_video_id)
+    write_metadatas(metadatas_filename, metadatas)
+
+    log.write_to_disk(os.path.splitext(metadatas_filename)[0] + ".log")
+
+    return offset_map
+
+
 """
 def export_metadatas(ref_video_id, prm_video_id, prm_video_service, detected_sample_time, prm_video_start_time, log):
     if log is None:
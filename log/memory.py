@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+import contextlib
+import tracemalloc
+
+
+# Peak memory of the stages of a job, written in the job logs to size the workers.
+# RSS is sampled from /proc by a background thread (Linux only, None elsewhere). tracemalloc sees
+# the Python and numpy allocations but slows pure Python code down, so it is opt-in.
+
+RSS_POLL_INTERVAL = 0.05
+
+
+def get_rss():
+    try:
+        with open("/proc/self/statm", "r") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def get_memory_headroom(memory_budget):
+    # Bytes left in the budget (in MB) for what the process is about to allocate, None without a budget
+    if not memory_budget:
+        return None
+
+    rss = get_rss() or 0
+
+    return max(memory_budget * 2 ** 20 - rss, 0)
+
+
+def format_size(n_bytes):
+    return f"{n_bytes / 2 ** 20:.1f} MB"
+
+
+@contextlib.contextmanager
+def track_memory(logs, stage, memory_budget=None, trace=False):
+    start_rss = get_rss()
+    peak_rss = [start_rss]
+    is_done = threading.Event()
+
+    def poll_rss():
+        while not is_done.wait(RSS_POLL_INTERVAL):
+            peak_rss[0] = max(peak_rss[0], get_rss() or 0)
+
+    if start_rss is not None:
+        poll_thread = threading.Thread(target=poll_rss, daemon=True)
+        poll_thread.start()
+
+    is_tracing = trace and not tracemalloc.is_tracing()
+
+    if is_tracing:
+        tracemalloc.start()
+    elif trace:
+        tracemalloc.reset_peak()
+
+    stage_start_time = time.time()
+
+    try:
+        yield
+    finally:
+        is_done.set()
+
+        if start_rss is not None:
+            poll_thread.join()
+            peak_rss[0] = max(peak_rss[0], get_rss() or 0)
+
+        msg = f"Memory of stage {stage} : "
+
+        if start_rss is not None:
+            msg += f"peak RSS {format_size(peak_rss[0])} (+{format_size(max(peak_rss[0] - start_rss, 0))})"
+        else:
+            msg += "peak RSS unknown"
+
+        if trace:
+            traced_size, traced_peak = tracemalloc.get_traced_memory()
+            msg += f", peak traced {format_size(traced_peak)}"
+
+            if is_tracing:
+                tracemalloc.stop()
+
+        msg += f", in {round(time.time() - stage_start_time, 2)}s"
+
+        for log in logs:
+            log.add(msg)
+
+            if memory_budget and start_rss is not None and peak_rss[0] > memory_budget * 2 ** 20:
+                log.add(f"Stage {stage} went over the memory budget of {memory_budget} MB", prefix="!")
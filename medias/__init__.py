@@ -1,30 +1,35 @@
 import youtube_dl
-import streamlink
 import subprocess
 import os
 import re
+import threading
+import concurrent.futures
+
+import numpy as np
+
+import detection.pcm
+from medias import hls
+from medias import cache as media_cache
+from medias.resolver import resolve_streams
+from medias import duration as media_duration
 
 
 def get_video_duration(video_url):
-    ydl_opts = {
-        'noplaylist': True,
-        'quiet': True,
-        'simulate': True,
-    }
+    return media_duration.get_duration(video_url)
 
-    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-        dict_meta = ydl.extract_info(video_url, download=True)
-        return dict_meta["duration"]
+
+def is_video_duration_final(video_url):
+    return media_duration.is_duration_final(video_url)
 
 
 def get_audio_stream_url(video_url):
-    streams = streamlink.streams(video_url)
+    streams = resolve_streams(video_url)
 
     audio_sources = list(filter(lambda n: "audio" in n, streams))
 
     if audio_sources:
         audio_source_name = audio_sources[0]
-        return streams[audio_source_name].url
+        return streams[audio_source_name]
 
 
 def get_media_stream_url(media_url):
@@ -37,38 +42,106 @@ def get_media_stream_url(media_url):
         media_url = media_url
 
     if not is_local:
-        streams = streamlink.streams(media_url)
+        streams = resolve_streams(media_url)
         if streams:
-            return streams["best"].url
+            return streams["best"]
         else:
             return media_url
     else:
         return media_url
 
 
-def download_audio(input_url, output_video, start_time=None, duration=None, rate=None):
+def download_audio(input_url, output_video, start_time=None, duration=None, rate=None, cache=None):
+    if cache is not None:
+        media_key = media_cache.get_media_key(input_url, start_time, duration, rate, os.path.splitext(output_video)[1])
+        return cache.download(media_key, output_video, lambda output_path: download_audio(input_url, output_path, start_time, duration, rate))
+
+    # Times also come as "HH:MM:SS" (see find_offset), the HLS segments are picked with seconds
+    start_time = media_cache.get_seconds(start_time) if start_time else None
+    duration = media_cache.get_seconds(duration) if duration else None
+
     audio_stream_url = get_audio_stream_url(input_url)
     
+    ffmpeg_input_flags = []
     ffmpeg_flags = []
+    input_data = None
     
     if audio_stream_url:
         if rate:
             ffmpeg_flags += ["-ar", str(rate)]
         
-        if start_time:
-            ffmpeg_flags += ["-ss", str(start_time)]
+        if hls.is_hls_url(audio_stream_url):
+            # Only the segments covering the range are downloaded, over kept-alive connections, and given
+            # to ffmpeg through its stdin
+            segments = hls.get_covering_segments(hls.get_segments(audio_stream_url), start_time or 0, start_time + duration if start_time and duration else duration)
+
+            if not segments:
+                return False
+
+            input_data = hls.iter_segments_data(segments)
+            audio_stream_url = "pipe:0"
+
+            if start_time:
+                ffmpeg_flags += ["-ss", str(start_time - segments[0]["start"])]
+        elif start_time:
+            # Input seeking : ffmpeg jumps to the right HLS segment instead of downloading everything before it
+            ffmpeg_input_flags += ["-ss", str(start_time)]
         
         if duration:
             ffmpeg_flags += ["-t", str(duration)]
         
-        process = subprocess.Popen(['ffmpeg', '-y', '-i', audio_stream_url, *ffmpeg_flags, output_video])
+        process = subprocess.Popen(['ffmpeg', '-y', *ffmpeg_input_flags, '-i', audio_stream_url, *ffmpeg_flags, output_video], stdin=subprocess.PIPE if input_data else None)
+
+        if input_data:
+            feed_thread, feed_errors = feed_process(process, input_data)
+
         process.wait()
+
+        if input_data:
+            feed_thread.join()
+
+            if feed_errors:
+                raise feed_errors[0]
+
         return process.returncode == 0
     
     return False
 
 
-def download_audio_ytdl(input_url, output_video, start_time=None, duration=None, rate=None):
+def feed_process(process, input_data):
+    # Writes the input data to the stdin of ffmpeg from a thread, while its output is being read.
+    # Errors are kept for the caller, an exception in the thread would go unnoticed.
+    feed_errors = []
+
+    def feed():
+        try:
+            for data in input_data:
+                process.stdin.write(data)
+        except (BrokenPipeError, OSError):
+            # ffmpeg stopped reading : it has the duration it was asked for, or was killed by the consumer
+            pass
+        except Exception as e:
+            feed_errors.append(e)
+        finally:
+            if hasattr(input_data, "close"):
+                input_data.close()
+
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    feed_thread = threading.Thread(target=feed, daemon=True)
+    feed_thread.start()
+
+    return feed_thread, feed_errors
+
+
+def download_audio_ytdl(input_url, output_video, start_time=None, duration=None, rate=None, cache=None):
+    if cache is not None:
+        media_key = media_cache.get_media_key(input_url, start_time, duration, rate, os.path.splitext(output_video)[1])
+        return cache.download(media_key, output_video, lambda output_path: download_audio_ytdl(input_url, output_path, start_time, duration, rate))
+
     output_video_basename = os.path.splitext(output_video)[0]
 
     ffmpeg_flags = []
@@ -88,3 +161,286 @@ def download_audio_ytdl(input_url, output_video, start_time=None, duration=None,
     return process.returncode == 0
 
 
+def get_audio_stream_url_ytdl(video_url):
+    ydl_opts = {
+        'format': '249/bestaudio',
+        'noplaylist': True,
+        'quiet': True,
+    }
+
+    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        dict_meta = ydl.extract_info(video_url, download=False)
+        return dict_meta["url"]
+
+
+def stream_audio(input_url, start_time=None, duration=None, rate=None, block_length=1 << 16, use_ytdl=False):
+    # Decoded mono float32 blocks read from an ffmpeg pipe : no temporary file, and the caller
+    # can work on the first blocks while the rest is still downloading
+    if use_ytdl:
+        audio_stream_url = get_audio_stream_url_ytdl(input_url)
+    else:
+        audio_stream_url = get_audio_stream_url(input_url)
+
+    if not audio_stream_url:
+        return
+
+    if hls.is_hls_url(audio_stream_url):
+        start_time = media_cache.get_seconds(start_time) if start_time else 0
+        duration = media_cache.get_seconds(duration) if duration else None
+
+        yield from stream_hls_audio(hls.get_segments(audio_stream_url), start_time, duration=duration, rate=rate, block_length=block_length)
+        return
+
+    yield from stream_audio_url(audio_stream_url, start_time=start_time, duration=duration, rate=rate, block_length=block_length)
+
+
+def stream_audio_url(audio_stream_url, start_time=None, duration=None, rate=None, block_length=1 << 16, input_flags=(), output_seek=False, input_data=None):
+    ffmpeg_input_flags = list(input_flags)
+    ffmpeg_flags = ["-ac", "1"]
+
+    if rate:
+        ffmpeg_flags += ["-ar", str(rate)]
+
+    # Output seeking decodes everything before start_time, only used when that's a few seconds at most
+    if start_time and output_seek:
+        ffmpeg_flags += ["-ss", str(start_time)]
+    elif start_time:
+        ffmpeg_input_flags += ["-ss", str(start_time)]
+
+    if duration:
+        ffmpeg_flags += ["-t", str(duration)]
+
+    process = subprocess.Popen(['ffmpeg', '-loglevel', 'error', *ffmpeg_input_flags, '-i', audio_stream_url, *ffmpeg_flags, '-f', 'f32le', '-'], stdin=subprocess.PIPE if input_data else None, stdout=subprocess.PIPE)
+
+    if input_data:
+        feed_thread, feed_errors = feed_process(process, input_data)
+
+    is_read = False
+
+    try:
+        remainder = b""
+
+        while True:
+            data = process.stdout.read(block_length * 4)
+
+            if not data:
+                break
+
+            data = remainder + data
+            n_bytes = len(data) // 4 * 4
+            remainder = data[n_bytes:]
+
+            if n_bytes:
+                yield np.frombuffer(data[:n_bytes], dtype=np.float32)
+
+        is_read = True
+    finally:
+        # Also reached when the consumer stops early : no need to download the rest
+        if not is_read and process.poll() is None:
+            process.kill()
+
+        process.stdout.close()
+        process.wait()
+
+        if input_data:
+            feed_thread.join()
+
+    if input_data and feed_errors:
+        raise feed_errors[0]
+
+    # A decode failing partway would otherwise look like a shorter video
+    if process.returncode != 0:
+        raise Exception(f"<!!> ffmpeg failed decoding {audio_stream_url} (exit code {process.returncode})")
+
+
+def fit_blocks(sound_stream, length, block_length=1 << 16):
+    # Exactly length samples : the stream is cut, or padded with silence
+    position = 0
+
+    for block in sound_stream:
+        block = block[:length - position]
+        position += block.shape[0]
+
+        if block.shape[0]:
+            yield block
+
+        if position >= length:
+            if hasattr(sound_stream, "close"):
+                sound_stream.close()
+            return
+
+    while position < length:
+        yield np.zeros(min(block_length, length - position), dtype=np.float32)
+        position += block_length
+
+
+def stream_hls_audio(segments, start_time, duration=None, rate=None, block_length=1 << 16):
+    # Only the segments covering the range are downloaded and given to ffmpeg through its stdin, then
+    # the start of the first one is skipped
+    covering_segments = hls.get_covering_segments(segments, start_time, start_time + duration if duration else None)
+
+    if not covering_segments:
+        return
+
+    yield from stream_audio_url("pipe:0",
+                                start_time=start_time - covering_segments[0]["start"],
+                                duration=duration,
+                                rate=rate,
+                                block_length=block_length,
+                                output_seek=True,
+                                input_data=hls.iter_segments_data(covering_segments))
+
+
+def get_muted_ranges(input_url):
+    audio_stream_url = get_audio_stream_url(input_url)
+
+    if not audio_stream_url or not hls.is_hls_url(audio_stream_url):
+        return []
+
+    return hls.get_segment_ranges(hls.get_segments(audio_stream_url), muted=True)
+
+
+def stream_audio_unmuted(input_url, rate, muted_ranges=None, block_length=1 << 16):
+    # Like stream_audio over the whole video, but the muted ranges of an HLS playlist are silence generated
+    # here instead of downloaded, and every audible range lands on the exact sample it starts at
+    audio_stream_url = get_audio_stream_url(input_url)
+
+    if not audio_stream_url:
+        return
+
+    if not hls.is_hls_url(audio_stream_url):
+        yield from stream_audio_url(audio_stream_url, rate=rate, block_length=block_length)
+        return
+
+    segments = hls.get_segments(audio_stream_url)
+
+    if muted_ranges is None:
+        muted_ranges = hls.get_segment_ranges(segments, muted=True)
+
+    if not muted_ranges:
+        yield from stream_hls_audio(segments, 0, rate=rate, block_length=block_length)
+        return
+
+    video_duration = segments[-1]["start"] + segments[-1]["duration"]
+    audible_start = 0
+
+    for muted_start, muted_end in muted_ranges + [(video_duration, video_duration)]:
+        audible_length = round(muted_start * rate) - round(audible_start * rate)
+
+        if audible_length > 0:
+            yield from fit_blocks(stream_hls_audio(segments, audible_start, muted_start - audible_start, rate, block_length), audible_length, block_length)
+
+        yield from fit_blocks([], round(muted_end * rate) - round(muted_start * rate), block_length)
+
+        audible_start = muted_end
+
+
+def download_audio_pcm(input_url, pcm_path, rate, muted_ranges=None):
+    return detection.pcm.write_pcm(pcm_path, stream_audio_unmuted(input_url, rate, muted_ranges), rate) > 0
+
+
+def split_audible_ranges(segments, muted_ranges, n_ranges):
+    # Ranges of about the same audible duration, cut between segments so no ffmpeg has to seek into one
+    video_duration = segments[-1]["start"] + segments[-1]["duration"]
+    audible_ranges = []
+    audible_start = 0
+
+    for muted_start, muted_end in muted_ranges + [(video_duration, video_duration)]:
+        if muted_start > audible_start:
+            audible_ranges.append((audible_start, muted_start))
+
+        audible_start = muted_end
+
+    range_duration = sum(end - start for start, end in audible_ranges) / max(n_ranges, 1)
+    ranges = []
+
+    for audible_start, audible_end in audible_ranges:
+        range_start = audible_start
+
+        for segment in segments:
+            if range_start < segment["start"] < audible_end and segment["start"] - range_start >= range_duration:
+                ranges.append((range_start, segment["start"]))
+                range_start = segment["start"]
+
+        ranges.append((range_start, audible_end))
+
+    return ranges
+
+
+def download_range_pcm(segments, pcm_path, start_time, end_time, rate, block_length=1 << 16):
+    # Decodes one range of the video into its place in a PCM file already sized for the whole video
+    offset = round(start_time * rate)
+    length = round(end_time * rate) - offset
+    decoded_length = 0
+
+    def count_blocks(sound_stream):
+        nonlocal decoded_length
+
+        for block in sound_stream:
+            decoded_length += block.shape[0]
+            yield block
+
+    with open(pcm_path, "r+b") as fp:
+        fp.seek(detection.pcm.PCM_HEADER_SIZE + offset * 4)
+
+        for block in fit_blocks(count_blocks(stream_hls_audio(segments, start_time, end_time - start_time, rate, block_length)), length, block_length):
+            fp.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+
+    # A few samples of difference come from the segment durations rounding, not from a failed download
+    if decoded_length < length - rate:
+        raise Exception(f"<!!> Only {decoded_length} of {length} samples decoded between {start_time}s and {end_time}s")
+
+
+def download_audio_pcm_parallel(input_url, pcm_path, rate, max_workers=4, muted_ranges=None, block_length=1 << 16, cache=None):
+    # The whole reference is keyed by its video only : a VOD still being recorded isn't cached, it would
+    # be served truncated once it ended
+    if cache is not None and is_video_duration_final(input_url):
+        media_key = media_cache.get_media_key(input_url, rate=rate, ext=".pcm")
+        return cache.download(media_key, pcm_path, lambda output_path: download_audio_pcm_parallel(input_url, output_path, rate, max_workers, muted_ranges, block_length))
+
+    # Same output as download_audio_pcm, but the HLS playlist is split in time ranges decoded by up to
+    # max_workers ffmpeg at once, each one writing its samples straight at their offset in the PCM file.
+    # Every sample lands at the index of a decode in one go, only the resampling phase of each range
+    # can differ by a fraction of sample.
+    audio_stream_url = get_audio_stream_url(input_url)
+
+    if not audio_stream_url:
+        return False
+
+    if not hls.is_hls_url(audio_stream_url) or max_workers <= 1:
+        return download_audio_pcm(input_url, pcm_path, rate, muted_ranges)
+
+    segments = hls.get_segments(audio_stream_url)
+
+    if not segments:
+        raise Exception(f"<!!> No segment in HLS playlist {audio_stream_url}")
+
+    if muted_ranges is None:
+        muted_ranges = hls.get_segment_ranges(segments, muted=True)
+
+    length = round((segments[-1]["start"] + segments[-1]["duration"]) * rate)
+
+    # Sized upfront, muted ranges are never written and stay zeros
+    with open(pcm_path, "wb") as fp:
+        fp.write(detection.pcm.PCM_HEADER.pack(detection.pcm.PCM_MAGIC, rate, b"f4".ljust(4, b"\0"), length).ljust(detection.pcm.PCM_HEADER_SIZE, b"\0"))
+        fp.truncate(detection.pcm.PCM_HEADER_SIZE + length * 4)
+
+    # A few more ranges than workers, so one slow range doesn't leave the others idle at the end
+    ranges = split_audible_ranges(segments, muted_ranges, max_workers * 2)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(download_range_pcm, segments, pcm_path, start_time, end_time, rate, block_length) for start_time, end_time in ranges]
+
+        for future in futures:
+            future.result()
+
+    return True
+
+
+def load_audio(input_url, start_time=None, duration=None, rate=None, use_ytdl=False):
+    blocks = list(stream_audio(input_url, start_time=start_time, duration=duration, rate=rate, use_ytdl=use_ytdl))
+
+    if not blocks:
+        return np.zeros(0, dtype=np.float32)
+
+    return np.concatenate(blocks)
@@ -0,0 +1,136 @@
+import os
+import uuid
+import shutil
+import hashlib
+
+from medias.parsers import get_video_service_id
+
+
+# Downloaded and decoded audio kept between jobs, addressed by what it is (service, video id, time
+# range, rate) rather than by the job that fetched it, so every job of the machine shares it. Files
+# are written under a temporary name then renamed, nobody reads half of one. Past max_size bytes the
+# least recently used entries are removed, use being tracked with their modification time.
+
+
+def get_seconds(time_value):
+    # Times are given in seconds or as "HH:MM:SS" depending on the caller
+    if isinstance(time_value, str):
+        seconds = 0.
+
+        for part in time_value.split(":"):
+            seconds = seconds * 60 + float(part)
+
+        return seconds
+
+    return float(time_value)
+
+
+def get_media_key(input_url, start_time=None, duration=None, rate=None, ext=""):
+    try:
+        video_id, video_service = get_video_service_id(input_url)
+    except Exception:
+        # Not a known service (e.g. a direct stream url) : the url is the identity
+        video_id, video_service = input_url, "url"
+
+    start_time = get_seconds(start_time) if start_time else 0.
+    duration = get_seconds(duration) if duration else None
+
+    key = f"{video_service}|{video_id}|{start_time}|{duration}|{rate}"
+
+    return hashlib.sha1(key.encode()).hexdigest() + ext
+
+
+def get_temp_path(path):
+    # Unique sibling of path with the same extension, ffmpeg picks the output format from it
+    path_base, path_ext = os.path.splitext(path)
+    return f"{path_base}.tmp{uuid.uuid4().hex}{path_ext}"
+
+
+def link_file(source_path, output_path):
+    # Hard link when possible, the entries of the reference are hundreds of MB
+    temp_path = get_temp_path(output_path)
+
+    try:
+        os.link(source_path, temp_path)
+    except OSError:
+        shutil.copyfile(source_path, temp_path)
+
+    os.replace(temp_path, output_path)
+
+
+class MediaCache:
+    def __init__(self, cache_dir, max_size):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def fetch(self, key, output_path):
+        entry_path = self.get_path(key)
+
+        try:
+            os.utime(entry_path)
+            link_file(entry_path, output_path)
+        except FileNotFoundError:
+            # Not cached, or evicted by another job in the meantime
+            return False
+
+        return True
+
+    def store(self, key, source_path):
+        link_file(source_path, self.get_path(key))
+        self.evict()
+
+    def evict(self):
+        entries = []
+
+        for entry in os.scandir(self.cache_dir):
+            # Files being written by other jobs aren't entries yet
+            if ".tmp" in entry.name:
+                continue
+
+            try:
+                entry_stat = entry.stat()
+            except FileNotFoundError:
+                continue
+
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry.path))
+
+        cache_size = sum(entry_size for entry_mtime, entry_size, entry_path in entries)
+
+        for entry_mtime, entry_size, entry_path in sorted(entries):
+            if cache_size <= self.max_size:
+                break
+
+            try:
+                os.remove(entry_path)
+            except OSError:
+                # Already removed by another job, or still open on Windows
+                continue
+
+            cache_size -= entry_size
+
+    def download(self, key, output_path, download_function):
+        # download_function(path) writes the media at path and returns whether it succeeded. Downloads
+        # go to a temporary path first : output_path may be a hard link of an entry, which must not be
+        # truncated by the next download writing there.
+        if self.fetch(key, output_path):
+            return True
+
+        temp_path = get_temp_path(output_path)
+
+        try:
+            is_downloaded = download_function(temp_path)
+
+            if is_downloaded:
+                self.store(key, temp_path)
+                os.replace(temp_path, output_path)
+
+            return is_downloaded
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
@@ -0,0 +1,184 @@
+import os
+import json
+import datetime
+import threading
+
+import youtube_dl
+
+import utils.time
+from medias import hls
+from medias.parsers import get_video_service_id, get_twitch_id_from_url
+from medias.resolver import resolve_streams
+
+
+# Video durations from the cheapest source that knows them : the Twitch API, then the sum of the
+# #EXTINF of the HLS playlist, and youtube-dl's full extraction when nothing else worked. A VOD keeps
+# its duration, they are memoized in memory and on disk, except for VODs still being recorded.
+
+CACHE_PATH = "durations_cache.json"  # Default when the config doesn't set DURATIONS_CACHE_PATH
+RECORDING_MARGIN = 600  # Seconds after its last recorded second a Twitch VOD may still be growing
+
+memory_cache = {}
+cache_lock = threading.Lock()
+is_disk_cache_loaded = False
+
+
+def get_duration_key(video_url):
+    try:
+        video_id, video_service = get_video_service_id(video_url)
+    except Exception:
+        return video_url
+
+    return f"{video_service}_{video_id}"
+
+
+def get_cache_path():
+    # Read here : medias is also used without the app config
+    try:
+        import config
+    except ImportError:
+        return CACHE_PATH
+
+    return getattr(config, "DURATIONS_CACHE_PATH", CACHE_PATH)
+
+
+def get_duration_twitch(video_url):
+    # Returns (duration, is_final), the duration of a VOD ending about now can still grow
+    # Imported here : the Twitch API client needs the app config, medias doesn't otherwise
+    from metadatas.retrieve import retrieve_metadatas
+
+    metadatas = retrieve_metadatas(get_twitch_id_from_url(video_url))
+
+    if not metadatas or not metadatas.get("duration"):
+        return None, False
+
+    duration = utils.time.parse_duration(metadatas["duration"])
+
+    if duration is None:
+        return None, False
+
+    created_at = metadatas.get("created_at")
+
+    if not isinstance(created_at, datetime.datetime):
+        return duration.total_seconds(), False
+
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=datetime.timezone.utc)
+
+    recorded_until = created_at + duration
+    is_final = (datetime.datetime.now(datetime.timezone.utc) - recorded_until).total_seconds() > RECORDING_MARGIN
+
+    return duration.total_seconds(), is_final
+
+
+def get_duration_hls(video_url):
+    # Returns (duration, is_final) : the playlist of a VOD being recorded has no end tag yet
+    # Every variant has the same timeline, the first HLS one is enough
+    for stream_url in resolve_streams(video_url).values():
+        if hls.is_hls_url(stream_url):
+            segments, is_ended = hls.get_media_playlist(stream_url)
+
+            if not segments:
+                return None, False
+
+            return sum(segment["duration"] for segment in segments), is_ended
+
+    return None, False
+
+
+def get_duration_ytdl(video_url):
+    ydl_opts = {
+        'noplaylist': True,
+        'quiet': True,
+        'simulate': True,
+    }
+
+    with youtube_dl.YoutubeDL(ydl_opts) as ydl:
+        dict_meta = ydl.extract_info(video_url, download=True)
+        return dict_meta.get("duration"), not dict_meta.get("is_live")
+
+
+def load_disk_cache():
+    global is_disk_cache_loaded
+
+    if is_disk_cache_loaded:
+        return
+
+    is_disk_cache_loaded = True
+
+    cache_path = get_cache_path()
+
+    if not os.path.exists(cache_path):
+        return
+
+    try:
+        with open(cache_path, "r") as fp:
+            disk_cache = json.load(fp)
+    except (OSError, ValueError):
+        return
+
+    for duration_key, duration in disk_cache.items():
+        if duration is not None:
+            memory_cache.setdefault(duration_key, duration)
+
+
+def save_disk_cache():
+    cache_path = get_cache_path()
+
+    # Written next to the cache then renamed, another process never reads half a file
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+
+    try:
+        with open(tmp_path, "w") as fp:
+            json.dump(memory_cache, fp, indent=4)
+
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"<!> Can't write the durations cache {cache_path} : {e}")
+
+
+def get_duration(video_url):
+    duration_key = get_duration_key(video_url)
+
+    with cache_lock:
+        load_disk_cache()
+
+        if duration_key in memory_cache:
+            return memory_cache[duration_key]
+
+    duration, is_final = None, False
+
+    if "twitch.tv" in video_url:
+        try:
+            duration, is_final = get_duration_twitch(video_url)
+        except Exception as e:
+            print(f"<!> Can't get the duration of {video_url} from the Twitch API : {e}")
+
+    if duration is None:
+        try:
+            duration, is_final = get_duration_hls(video_url)
+        except Exception as e:
+            print(f"<!> Can't get the duration of {video_url} from its HLS playlist : {e}")
+
+    if duration is None:
+        duration, is_final = get_duration_ytdl(video_url)
+
+    # A failed lookup is tried again next time, and a VOD being recorded is still growing
+    if duration is not None and is_final:
+        with cache_lock:
+            memory_cache[duration_key] = duration
+            save_disk_cache()
+
+    return duration
+
+
+def is_duration_final(video_url):
+    # Only final durations are memoized : a video that can't be looked up counts as still changing
+    try:
+        get_duration(video_url)
+    except Exception as e:
+        print(f"<!> Can't get the duration of {video_url} : {e}")
+        return False
+
+    with cache_lock:
+        return get_duration_key(video_url) in memory_cache
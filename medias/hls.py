@@ -0,0 +1,165 @@
+import re
+import threading
+import collections
+import urllib.parse
+import concurrent.futures
+
+import requests
+import requests.adapters
+
+
+# Minimal m3u8 reader for VOD playlists, and a segment fetcher so only the segments of the wanted time
+# range are downloaded, over kept-alive connections. Twitch keeps DMCA-muted parts of a VOD as
+# "<n>-muted.ts" segments (silent audio), restored ones are "<n>-unmuted.ts".
+
+MUTED_SEGMENT_REG = re.compile(r"-muted\.ts(?:\?|$)", re.I)
+
+SESSION_POOL_SIZE = 16  # Kept-alive connections per host, shared by every job of the process
+PREFETCH_SEGMENTS = 2  # Segments downloaded ahead of the one the decoder is reading
+
+session = None
+session_lock = threading.Lock()
+
+
+def is_hls_url(url):
+    return urllib.parse.urlparse(url).path.lower().endswith(".m3u8")
+
+
+def get_session():
+    global session
+
+    with session_lock:
+        if session is None:
+            adapter = requests.adapters.HTTPAdapter(pool_connections=SESSION_POOL_SIZE, pool_maxsize=SESSION_POOL_SIZE)
+
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+
+        return session
+
+
+def fetch_playlist(playlist_url):
+    response = get_session().get(playlist_url, timeout=30)
+
+    if response.status_code != 200:
+        raise Exception(f"<!!> Can't fetch HLS playlist {playlist_url} (HTTP {response.status_code})")
+
+    return response.text
+
+
+def parse_playlist(playlist_text, playlist_url):
+    # Returns (variant playlist urls, segments), only one of them is filled depending on the playlist kind
+    variant_urls = []
+    segments = []
+
+    segment_duration = None
+    map_url = None
+    is_variant = False
+    segment_start = 0.
+
+    for line in playlist_text.splitlines():
+        line = line.strip()
+
+        if not line:
+            continue
+
+        if line.startswith("#EXT-X-STREAM-INF"):
+            is_variant = True
+        elif line.startswith("#EXTINF:"):
+            segment_duration = float(line[len("#EXTINF:"):].split(",")[0])
+        elif line.startswith("#EXT-X-MAP:"):
+            # Initialization section of fragmented MP4 segments
+            map_url = urllib.parse.urljoin(playlist_url, re.search(r'URI="([^"]+)"', line).group(1))
+        elif not line.startswith("#"):
+            url = urllib.parse.urljoin(playlist_url, line)
+
+            if is_variant:
+                variant_urls.append(url)
+                is_variant = False
+            elif segment_duration is not None:
+                segments.append({
+                    "url": url,
+                    "start": segment_start,
+                    "duration": segment_duration,
+                    "muted": MUTED_SEGMENT_REG.search(line) is not None,
+                    "map_url": map_url,
+                })
+
+                segment_start += segment_duration
+                segment_duration = None
+
+    return variant_urls, segments
+
+
+def get_media_playlist(playlist_url):
+    # Returns (segments, is_ended) : a playlist without #EXT-X-ENDLIST is still being written,
+    # a live stream or a VOD being recorded
+    playlist_text = fetch_playlist(playlist_url)
+    variant_urls, segments = parse_playlist(playlist_text, playlist_url)
+
+    # Master playlist : every variant has the same timeline, the first one is enough
+    if variant_urls:
+        return get_media_playlist(variant_urls[0])
+
+    return segments, "#EXT-X-ENDLIST" in playlist_text
+
+
+def get_segments(playlist_url):
+    return get_media_playlist(playlist_url)[0]
+
+
+def get_segment_ranges(segments, muted):
+    # Merged (start, end) time ranges of the muted segments, or of the audible ones
+    ranges = []
+
+    for segment in segments:
+        if segment["muted"] != muted:
+            continue
+
+        segment_end = segment["start"] + segment["duration"]
+
+        if ranges and abs(ranges[-1][1] - segment["start"]) < 1e-6:
+            ranges[-1] = (ranges[-1][0], segment_end)
+        else:
+            ranges.append((segment["start"], segment_end))
+
+    return ranges
+
+
+def get_covering_segments(segments, start_time, end_time=None):
+    return [segment for segment in segments if segment["start"] + segment["duration"] > start_time and (end_time is None or segment["start"] < end_time)]
+
+
+def fetch_segment(segment_url):
+    response = get_session().get(segment_url, timeout=30)
+
+    if response.status_code != 200:
+        raise Exception(f"<!!> Can't fetch HLS segment {segment_url} (HTTP {response.status_code})")
+
+    return response.content
+
+
+def iter_segments_data(segments):
+    # Bytes of the segments in order, as one stream a decoder can read : the initialization section of
+    # fragmented MP4 segments comes first, and the next segments download while one is being read
+    with concurrent.futures.ThreadPoolExecutor(max_workers=PREFETCH_SEGMENTS) as executor:
+        pending_data = collections.deque()
+        i_next = 0
+        map_url = None
+
+        try:
+            for segment in segments:
+                while i_next < len(segments) and len(pending_data) <= PREFETCH_SEGMENTS:
+                    pending_data.append(executor.submit(fetch_segment, segments[i_next]["url"]))
+                    i_next += 1
+
+                if segment["map_url"] and segment["map_url"] != map_url:
+                    map_url = segment["map_url"]
+                    yield fetch_segment(map_url)
+
+                yield pending_data.popleft().result()
+        finally:
+            # The decoder stopped early : what isn't downloaded yet never will be
+            for future in pending_data:
+                future.cancel()
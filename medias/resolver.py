@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import time
+import threading
+import urllib.parse
+import concurrent.futures
+
+import streamlink
+
+
+# Stream urls found by streamlink for a video page, shared by every caller of the process and kept on
+# disk between sessions : a resolution costs seconds of HTTP, and the same VOD is opened again and
+# again. Signed urls (Twitch usher tokens, YouTube googlevideo) carry the time they expire at, entries
+# are dropped a bit before that. Callers asking for a video being resolved wait for that resolution
+# instead of starting another one.
+
+CACHE_PATH = "streams_cache.json"  # Default when the config doesn't set STREAMS_CACHE_PATH
+DEFAULT_TTL = 3600  # Seconds an entry is kept when none of its urls tells when it expires
+EXPIRY_MARGIN = 120  # Seconds before the expiry an url is considered gone, it still has to be downloaded
+
+EXPIRY_PARAMS = ["expire", "expires", "Expires", "exp"]
+EXPIRY_TOKEN_REG = re.compile(r"(?:^|[~&])exp=(\d+)")  # Akamai hdnts/hdnea tokens
+
+memory_cache = {}
+pending_resolutions = {}
+cache_lock = threading.Lock()
+is_disk_cache_loaded = False
+
+
+def get_url_expiry(stream_url):
+    # Unix time the signed url stops working at, None when it doesn't say
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(stream_url).query)
+    expiries = []
+
+    for param in EXPIRY_PARAMS:
+        for value in query.get(param, []):
+            if value.isdigit():
+                expiries.append(int(value))
+
+    # Twitch usher playlists : the access token is a JSON document with an "expires" field
+    for token in query.get("token", []):
+        try:
+            expiries.append(int(json.loads(token)["expires"]))
+        except (ValueError, KeyError, TypeError):
+            pass
+
+    for param in ["hdnts", "hdnea", "__hdnea__"]:
+        for value in query.get(param, []):
+            res = EXPIRY_TOKEN_REG.search(value)
+
+            if res:
+                expiries.append(int(res.group(1)))
+
+    return min(expiries) if expiries else None
+
+
+def get_stream_url(stream):
+    # Muxed streams (separate video and audio) have no url of their own, the first substream is used
+    substreams = getattr(stream, "substreams", None)
+
+    if substreams:
+        return get_stream_url(substreams[0])
+
+    try:
+        return stream.to_url()
+    except (TypeError, AttributeError):
+        return getattr(stream, "url", None)
+
+
+def get_cache_path():
+    # Read here : medias is also used without the app config
+    try:
+        import config
+    except ImportError:
+        return CACHE_PATH
+
+    return getattr(config, "STREAMS_CACHE_PATH", CACHE_PATH)
+
+
+def get_entry_expiry(streams):
+    expiries = [get_url_expiry(stream_url) for stream_url in streams.values()]
+    expiries = [expiry - EXPIRY_MARGIN for expiry in expiries if expiry is not None]
+
+    return min(expiries + [time.time() + DEFAULT_TTL])
+
+
+def load_disk_cache():
+    global is_disk_cache_loaded
+
+    if is_disk_cache_loaded:
+        return
+
+    is_disk_cache_loaded = True
+
+    cache_path = get_cache_path()
+
+    if not os.path.exists(cache_path):
+        return
+
+    try:
+        with open(cache_path, "r") as fp:
+            disk_cache = json.load(fp)
+    except (OSError, ValueError):
+        # A corrupted cache only costs new resolutions
+        return
+
+    for video_url, entry in disk_cache.items():
+        if video_url not in memory_cache:
+            memory_cache[video_url] = entry
+
+
+def save_disk_cache():
+    now = time.time()
+    disk_cache = {video_url: entry for video_url, entry in memory_cache.items() if entry["expires_at"] > now}
+
+    cache_path = get_cache_path()
+
+    # Written next to the cache then renamed, another session never reads half a file
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+
+    try:
+        with open(tmp_path, "w") as fp:
+            json.dump(disk_cache, fp, indent=4)
+
+        os.replace(tmp_path, cache_path)
+    except OSError as e:
+        print(f"<!> Can't write the streams cache {cache_path} : {e}")
+
+
+def resolve_streams(video_url):
+    # Same as streamlink.streams, but a dict of stream name -> url. Raises the streamlink errors.
+    with cache_lock:
+        load_disk_cache()
+
+        entry = memory_cache.get(video_url)
+
+        if entry and entry["expires_at"] > time.time():
+            return dict(entry["streams"])
+
+        resolution = pending_resolutions.get(video_url)
+        is_resolving = resolution is None
+
+        if is_resolving:
+            resolution = concurrent.futures.Future()
+            pending_resolutions[video_url] = resolution
+
+    if not is_resolving:
+        return dict(resolution.result())
+
+    try:
+        streams = {}
+
+        for stream_name, stream in streamlink.streams(video_url).items():
+            stream_url = get_stream_url(stream)
+
+            if stream_url:
+                streams[stream_name] = stream_url
+    except Exception as e:
+        with cache_lock:
+            del pending_resolutions[video_url]
+
+        resolution.set_exception(e)
+        raise
+
+    with cache_lock:
+        memory_cache[video_url] = {"streams": streams, "expires_at": get_entry_expiry(streams)}
+        del pending_resolutions[video_url]
+
+        save_disk_cache()
+
+    resolution.set_result(streams)
+
+    return dict(streams)
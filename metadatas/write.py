@@ -8,7 +8,7 @@ from metadatas.retrieve import retrieve_metadatas
 from medias import get_video_duration
 
 
-def export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_duration, time_offset, log=None):
+def export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_duration, time_offset, log=None, offset_map=None):
     if log is None:
         log = Log()
     
@@ -32,6 +32,13 @@ def export_metadatas(ref_video_id, prm_video_id, prm_video_service, prm_video_du
         "duration": math.floor(prm_video_duration * 1000),
     }
 
+    if offset_map:
+        new_metadatas["permanent_id"]["offset_map"] = [{
+            "start": math.floor(segment["start"] * 1000),
+            "end": math.floor(segment["end"] * 1000),
+            "created_delay": math.floor(segment["offset"] * 1000),
+        } for segment in offset_map]
+
     return new_metadatas
     
 
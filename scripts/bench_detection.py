@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import multiprocessing
+import concurrent.futures
+
+import numpy as np
+import soundfile
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is reported as null there
+    resource = None
+
+import detection.sound
+import detection.fingerprint
+import detection.pcm
+
+
+# Speed, memory and accuracy of every matcher on synthetic references, written as JSON so runs can
+# be compared before deploying. References are generated block by block straight into a PCM cache
+# file, so the 8 hours one never has to fit in memory here (the matchers that load it whole will).
+# Run from the repository root : python -m scripts.bench_detection
+
+RATE = 8000
+SOURCE_DURATIONS = [600, 1800, 3600, 4 * 3600, 8 * 3600]
+TEMPLATE_DURATION = 20
+TEMPLATE_POSITIONS = [0.1234, 0.5, 0.8765]  # Relative to the reference duration
+TEMPLATE_NOISE = 0.05
+SEED = 0
+
+MATCHERS = ["loop", "fft", "fft_normalized", "pyramid", "batch", "peaks", "features", "parallel", "stream", "fingerprint"]
+LOOP_MAX_DURATION = 600  # The original hop loop takes hours past this
+OUTPUT_PATH = "bench_detection.json"
+
+BLOCK_DURATION = 60
+BEAT_DURATION = 0.25
+
+
+def generate_source_range(start, stop, rate, seed=0):
+    # Deterministic for any range : noise is seeded per block, tones only depend on the absolute time.
+    # Background noise, slowly breathing tones and a melody changing note every beat, like music.
+    tones_rng = np.random.default_rng(seed)
+    tone_freqs = tones_rng.uniform(100, 1500, 6)
+    tone_rates = tones_rng.uniform(0.05, 0.5, 6)
+    tone_phases = tones_rng.uniform(0, 2 * np.pi, 6)
+
+    block_length = BLOCK_DURATION * rate
+    blocks = []
+
+    for i_block in range(start // block_length, (stop - 1) // block_length + 1):
+        block_start = max(start, i_block * block_length)
+        block_stop = min(stop, (i_block + 1) * block_length)
+
+        noise = np.random.default_rng([seed, i_block]).standard_normal(block_length)
+        sound = 0.1 * noise[block_start - i_block * block_length:block_stop - i_block * block_length]
+
+        t = np.arange(block_start, block_stop) / rate
+
+        for freq, envelope_rate, phase in zip(tone_freqs, tone_rates, tone_phases):
+            envelope = 0.5 + 0.5 * np.sin(2 * np.pi * envelope_rate * t + phase)
+            sound += 0.15 * envelope * np.sin(2 * np.pi * freq * t)
+
+        beats = np.floor(t / BEAT_DURATION).astype(np.int64)
+        note_freqs = 220 * 2 ** (((beats * 2654435761 + seed) % 24) / 12)
+        sound += 0.2 * np.sin(2 * np.pi * note_freqs * t)
+
+        blocks.append(sound)
+
+    return (np.concatenate(blocks) / 2).astype(np.float32)
+
+
+def write_source(pcm_path, duration, rate, seed=0):
+    length = duration * rate
+    block_length = BLOCK_DURATION * rate
+
+    sound_stream = (generate_source_range(start, min(start + block_length, length), rate, seed) for start in range(0, length, block_length))
+    detection.pcm.write_pcm(pcm_path, sound_stream, rate)
+
+
+def get_peak_rss():
+    if resource is None:
+        return None
+
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+    # kB on Linux, bytes on macOS
+    return peak_rss if sys.platform == "darwin" else peak_rss * 1024
+
+
+def run_matcher(matcher, source_path, template_paths):
+    # Runs in a fresh process, so the peak RSS is this matcher's only
+    t_start = time.time()
+    extra = {}
+
+    if matcher == "loop":
+        # librosa can't read the PCM cache, the loop gets a WAV copy
+        wav_path = os.path.splitext(source_path)[0] + ".wav"
+        sound, rate = detection.pcm.open_pcm(source_path)
+        soundfile.write(wav_path, sound, rate)
+        t_start = time.time()
+        results = [detection.sound.find_audio_sample(wav_path, template_path) for template_path in template_paths]
+    elif matcher == "fft":
+        results = [detection.sound.find_audio_sample_fft(source_path, template_path) for template_path in template_paths]
+    elif matcher == "fft_normalized":
+        results = [detection.sound.find_audio_sample_fft(source_path, template_path, normalized=True) for template_path in template_paths]
+    elif matcher == "pyramid":
+        results = [detection.sound.find_audio_sample_pyramid(source_path, template_path) for template_path in template_paths]
+    elif matcher == "batch":
+        results = detection.sound.find_audio_samples(source_path, template_paths)
+    elif matcher == "peaks":
+        results = [detection.sound.find_audio_sample_peaks(source_path, template_path, n_peaks=1)[0][:2] for template_path in template_paths]
+    elif matcher == "features":
+        results = [detection.sound.find_audio_sample_features(source_path, template_path) for template_path in template_paths]
+    elif matcher == "parallel":
+        results = [detection.sound.find_audio_sample_parallel(source_path, template_path) for template_path in template_paths]
+    elif matcher == "stream":
+        source_rate, source_length = detection.sound.get_source_info(source_path)
+        results = detection.sound.find_audio_samples_in_stream(detection.sound.stream_source(source_path, block_length=1 << 16), source_rate, template_paths)
+    elif matcher == "fingerprint":
+        index = detection.fingerprint.build_index(source_path)
+        extra["index_time"] = time.time() - t_start
+        results = [detection.fingerprint.find_audio_sample(index, template_path, source_path) for template_path in template_paths]
+    else:
+        raise Exception(f"<!!> Unknown matcher {matcher}")
+
+    search_time = time.time() - t_start
+
+    return [(float(found_time), float(confidence)) for found_time, confidence in results], search_time, get_peak_rss(), extra
+
+
+def bench_matcher(matcher, source_path, template_paths):
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(run_matcher, matcher, source_path, template_paths).result()
+
+
+if __name__ == "__main__":
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": {
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+        },
+        "rate": RATE,
+        "template_duration": TEMPLATE_DURATION,
+        "results": [],
+    }
+
+    rng = np.random.default_rng(SEED + 1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for source_duration in SOURCE_DURATIONS:
+            source_path = os.path.join(tmp_dir, "source.pcm")
+            write_source(source_path, source_duration, RATE, seed=SEED)
+
+            # Noisy copies of parts of the reference, like a re-encoded permanent upload
+            template_paths = []
+            expected_times = []
+
+            for i, template_position in enumerate(TEMPLATE_POSITIONS):
+                template_start = round(template_position * (source_duration - TEMPLATE_DURATION) * RATE)
+                template_sound = generate_source_range(template_start, template_start + TEMPLATE_DURATION * RATE, RATE, seed=SEED)
+                template_sound = template_sound + TEMPLATE_NOISE * rng.standard_normal(template_sound.shape[0]).astype(np.float32)
+
+                template_path = os.path.join(tmp_dir, f"template_{i}.wav")
+                soundfile.write(template_path, template_sound, RATE)
+
+                template_paths.append(template_path)
+                expected_times.append(template_start / RATE)
+
+            for matcher in MATCHERS:
+                if matcher == "loop" and source_duration > LOOP_MAX_DURATION:
+                    continue
+
+                results, search_time, peak_rss, extra = bench_matcher(matcher, source_path, template_paths)
+                offset_errors = [abs(found_time - expected_time) for (found_time, confidence), expected_time in zip(results, expected_times)]
+
+                report["results"].append({
+                    "matcher": matcher,
+                    "source_duration": source_duration,
+                    "n_templates": len(template_paths),
+                    "search_time": search_time,
+                    "throughput": source_duration * len(template_paths) / search_time,  # Seconds of reference searched per second, per template
+                    "peak_rss": peak_rss,
+                    "offset_errors": offset_errors,
+                    "max_offset_error": max(offset_errors),
+                    "confidences": [confidence for found_time, confidence in results],
+                    **extra,
+                })
+
+                print(f"{source_duration:>6}s {matcher:>14} : {search_time:8.2f}s, {report['results'][-1]['throughput']:8.1f}x realtime, peak RSS {(peak_rss or 0) / 2 ** 20:7.1f} MB, max offset error {max(offset_errors):.4f}s")
+
+    with open(OUTPUT_PATH, "w") as fp:
+        json.dump(report, fp, indent=4)
+
+    print(f"Report written to {OUTPUT_PATH}")
@@ -0,0 +1,161 @@
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+import subprocess
+import functools
+import http.server
+
+import numpy as np
+
+import detection.pcm
+import medias
+from scripts.bench_detection import generate_source_range
+
+
+# Time to get a whole HLS reference into the PCM cache, with one ffmpeg against the range-split
+# download at several concurrency limits. The reference is a local HLS fixture served over HTTP, with
+# a delay per segment request to stand for the CDN latency, and Twitch-like muted segments.
+# Run from the repository root : python -m scripts.bench_download
+
+RATE = 8000
+SOURCE_DURATION = 3600
+SEGMENT_DURATION = 10
+MUTED_SEGMENTS = range(60, 90)  # "<n>-muted.ts" segments, silent in the fixture
+SEGMENT_DELAY = 0.1  # Seconds before the server answers a segment request
+WORKERS_LIST = [1, 2, 4, 8]
+OUTPUT_PATH = "bench_download.json"
+SEED = 0
+
+
+def write_fixture(fixture_dir, duration, rate, seed=0):
+    # Fragmented MP4 segments : same AAC audio as Twitch VODs, and ffmpeg can cut a playlist of them anywhere
+    process = subprocess.Popen(["ffmpeg", "-loglevel", "error", "-y",
+                                "-f", "f32le", "-ar", str(rate), "-ac", "1", "-i", "-",
+                                "-c:a", "aac", "-ar", "48000",
+                                "-f", "hls", "-hls_time", str(SEGMENT_DURATION), "-hls_playlist_type", "vod",
+                                "-hls_segment_type", "fmp4", "-hls_segment_filename", os.path.join(fixture_dir, "%d.ts"),
+                                os.path.join(fixture_dir, "index.m3u8")],
+                               stdin=subprocess.PIPE)
+
+    block_length = 60 * rate
+
+    for start in range(0, duration * rate, block_length):
+        sound = generate_source_range(start, min(start + block_length, duration * rate), rate, seed)
+
+        segment_ids = np.arange(start, start + sound.shape[0]) // (SEGMENT_DURATION * rate)
+        sound[np.isin(segment_ids, MUTED_SEGMENTS)] = 0
+
+        process.stdin.write(sound.astype(np.float32).tobytes())
+
+    process.stdin.close()
+
+    if process.wait() != 0:
+        raise Exception("<!!> Can't encode the HLS fixture")
+
+    playlist_path = os.path.join(fixture_dir, "index.m3u8")
+
+    with open(playlist_path, "r") as fp:
+        playlist_text = fp.read()
+
+    for segment_id in MUTED_SEGMENTS:
+        if os.path.exists(os.path.join(fixture_dir, f"{segment_id}.ts")):
+            os.rename(os.path.join(fixture_dir, f"{segment_id}.ts"), os.path.join(fixture_dir, f"{segment_id}-muted.ts"))
+            playlist_text = re.sub(rf"^{segment_id}\.ts$", f"{segment_id}-muted.ts", playlist_text, flags=re.M)
+
+    with open(playlist_path, "w") as fp:
+        fp.write(playlist_text)
+
+
+class FixtureRequestHandler(http.server.SimpleHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.endswith(".ts"):
+            time.sleep(SEGMENT_DELAY)
+
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_fixture(fixture_dir):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(FixtureRequestHandler, directory=fixture_dir))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return server
+
+
+def get_correlation(sound_a, sound_b):
+    sound_a = sound_a.astype(np.float64)
+    sound_b = sound_b.astype(np.float64)
+
+    return float(np.dot(sound_a, sound_b) / max(np.sqrt(np.dot(sound_a, sound_a) * np.dot(sound_b, sound_b)), 1e-9))
+
+
+if __name__ == "__main__":
+    report = {
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "cpu_count": os.cpu_count(),
+        "rate": RATE,
+        "source_duration": SOURCE_DURATION,
+        "segment_delay": SEGMENT_DELAY,
+        "results": [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_dir = os.path.join(tmp_dir, "vod")
+        os.makedirs(fixture_dir)
+        write_fixture(fixture_dir, SOURCE_DURATION, RATE, seed=SEED)
+
+        server = serve_fixture(fixture_dir)
+        playlist_url = f"http://127.0.0.1:{server.server_address[1]}/index.m3u8"
+
+        # The fixture is already a direct stream url, nothing for streamlink to resolve
+        medias.get_audio_stream_url = lambda input_url: input_url
+
+        serial_path = os.path.join(tmp_dir, "serial.pcm")
+
+        t_start = time.time()
+        medias.download_audio_pcm(playlist_url, serial_path, RATE)
+        serial_time = time.time() - t_start
+
+        serial_sound, serial_rate = detection.pcm.open_pcm(serial_path)
+
+        report["results"].append({"mode": "serial", "workers": 1, "time": serial_time, "length": int(serial_sound.shape[0])})
+        print(f"  serial : {serial_time:7.2f}s, {serial_sound.shape[0]} samples")
+
+        for workers in WORKERS_LIST:
+            parallel_path = os.path.join(tmp_dir, f"parallel_{workers}.pcm")
+
+            t_start = time.time()
+            medias.download_audio_pcm_parallel(playlist_url, parallel_path, RATE, max_workers=workers)
+            parallel_time = time.time() - t_start
+
+            parallel_sound, parallel_rate = detection.pcm.open_pcm(parallel_path)
+
+            # Ranges decoded on their own resample with another sub-sample phase, so the samples are
+            # compared by correlation and not for equality
+            correlation = get_correlation(serial_sound, parallel_sound) if parallel_sound.shape == serial_sound.shape else None
+
+            report["results"].append({
+                "mode": "parallel",
+                "workers": workers,
+                "time": parallel_time,
+                "speedup": serial_time / parallel_time,
+                "length": int(parallel_sound.shape[0]),
+                "correlation_with_serial": correlation,
+            })
+
+            print(f"{workers:>2} workers : {parallel_time:7.2f}s, x{serial_time / parallel_time:.2f}, {parallel_sound.shape[0]} samples, correlation with serial {correlation}")
+
+            del parallel_sound
+
+        del serial_sound
+        server.shutdown()
+
+    with open(OUTPUT_PATH, "w") as fp:
+        json.dump(report, fp, indent=4)
+
+    print(f"Report written to {OUTPUT_PATH}")
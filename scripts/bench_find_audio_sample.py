@@ -0,0 +1,59 @@
+import os
+import time
+import tempfile
+
+import numpy as np
+import soundfile
+
+import detection.sound
+
+
+# Compares the hop-by-hop np.correlate loop with the overlap-save FFT engine on synthetic audio.
+# Run from the repository root : python -m scripts.bench_find_audio_sample
+
+RATE = 8000
+SOURCE_DURATION = 120
+TEMPLATE_DURATION = 10
+TEMPLATE_POSITION = 73.6  # On the 128 samples hop grid so the loop can land on it
+
+
+def generate_source(duration, rate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(duration * rate)) / rate
+
+    sound = 0.1 * rng.standard_normal(t.shape[0])
+
+    for freq in rng.uniform(100, 1500, 8):
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * rng.uniform(0.05, 0.5) * t + rng.uniform(0, 2 * np.pi))
+        sound += 0.2 * envelope * np.sin(2 * np.pi * freq * t)
+
+    return (sound / np.abs(sound).max()).astype(np.float32)
+
+
+def bench(name, func, source_path, template_path):
+    t_start = time.time()
+    found_time, found_value = func(source_path, template_path)
+    search_time = time.time() - t_start
+
+    print(f"{name:>6} : found at {found_time:.3f}s (expected {TEMPLATE_POSITION}s) in {search_time:.2f}s, {SOURCE_DURATION / search_time:.1f}x realtime")
+
+    return search_time
+
+
+if __name__ == "__main__":
+    source_sound = generate_source(SOURCE_DURATION, RATE)
+
+    template_start = int(TEMPLATE_POSITION * RATE)
+    template_sound = source_sound[template_start:template_start + TEMPLATE_DURATION * RATE]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source.wav")
+        template_path = os.path.join(tmp_dir, "template.wav")
+
+        soundfile.write(source_path, source_sound, RATE)
+        soundfile.write(template_path, template_sound, RATE)
+
+        loop_time = bench("loop", detection.sound.find_audio_sample, source_path, template_path)
+        fft_time = bench("fft", detection.sound.find_audio_sample_fft, source_path, template_path)
+
+    print(f"Speedup : {loop_time / fft_time:.1f}x")
@@ -0,0 +1,49 @@
+import os
+import time
+import tempfile
+
+import soundfile
+
+import detection.sound
+from scripts.bench_find_audio_sample import generate_source
+
+
+# Scaling of the sharded search from 1 worker to all the cores of the machine.
+# Run from the repository root : python -m scripts.bench_parallel_search
+
+RATE = 8000
+SOURCE_DURATION = 1800
+TEMPLATE_DURATION = 60
+TEMPLATE_POSITION = 1234.5
+
+
+if __name__ == "__main__":
+    source_sound = generate_source(SOURCE_DURATION, RATE)
+
+    template_start = round(TEMPLATE_POSITION * RATE)
+    template_sound = source_sound[template_start:template_start + TEMPLATE_DURATION * RATE]
+
+    workers_list = [1]
+    while workers_list[-1] * 2 < os.cpu_count():
+        workers_list.append(workers_list[-1] * 2)
+    if workers_list[-1] != os.cpu_count():
+        workers_list.append(os.cpu_count())
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source_path = os.path.join(tmp_dir, "source.wav")
+        template_path = os.path.join(tmp_dir, "template.wav")
+
+        soundfile.write(source_path, source_sound, RATE)
+        soundfile.write(template_path, template_sound, RATE)
+
+        base_search_time = None
+
+        for workers in workers_list:
+            t_start = time.time()
+            found_time, found_value = detection.sound.find_audio_sample_parallel(source_path, template_path, workers=workers)
+            search_time = time.time() - t_start
+
+            if base_search_time is None:
+                base_search_time = search_time
+
+            print(f"{workers:>3} workers : found at {found_time:.3f}s (expected {TEMPLATE_POSITION}s) in {search_time:.2f}s, {SOURCE_DURATION / search_time:.1f}x realtime, speedup {base_search_time / search_time:.2f}x")
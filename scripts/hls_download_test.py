@@ -0,0 +1,59 @@
+import os
+import tempfile
+
+import numpy as np
+import soundfile
+
+import medias
+import detection.sound
+import utils.time
+from scripts.bench_detection import generate_source_range
+from scripts.bench_download import write_fixture, serve_fixture
+
+
+# Checks that chunks of an HLS video are cut at the right place, with times given in seconds or as
+# "HH:MM:SS" like find_offset does, through download_audio and stream_audio.
+# Run from the repository root : python -m scripts.hls_download_test
+
+RATE = 8000
+SOURCE_DURATION = 300
+CHUNK_DURATION = 20
+CHUNK_STARTS = [0, 37, 125, 250]
+MAX_OFFSET_ERROR = 0.05  # AAC encoder delay and resampling
+
+
+if __name__ == "__main__":
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        fixture_dir = os.path.join(tmp_dir, "vod")
+        os.makedirs(fixture_dir)
+        write_fixture(fixture_dir, SOURCE_DURATION, RATE)
+
+        server = serve_fixture(fixture_dir)
+        playlist_url = f"http://127.0.0.1:{server.server_address[1]}/index.m3u8"
+
+        medias.get_audio_stream_url = lambda input_url: input_url
+
+        source_sound = generate_source_range(0, SOURCE_DURATION * RATE, RATE)
+
+        for chunk_start in CHUNK_STARTS:
+            for start_time, duration in [(chunk_start, CHUNK_DURATION), (utils.time.format_time(chunk_start), utils.time.format_time(CHUNK_DURATION))]:
+                chunk_path = os.path.join(tmp_dir, "chunk.wav")
+
+                assert medias.download_audio(playlist_url, chunk_path, start_time=start_time, duration=duration, rate=RATE)
+                downloaded_sound, downloaded_rate = soundfile.read(chunk_path, dtype="float32")
+
+                streamed_sound = medias.load_audio(playlist_url, start_time=start_time, duration=duration, rate=RATE)
+
+                for method, chunk_sound in [("download_audio", downloaded_sound), ("stream_audio", streamed_sound)]:
+                    assert abs(chunk_sound.shape[0] - CHUNK_DURATION * RATE) <= 1, f"{method} returned {chunk_sound.shape[0]} samples"
+
+                    found_time, confidence = detection.sound.find_audio_samples_in_stream([source_sound], RATE, [chunk_sound[RATE:-RATE]])[0]
+                    offset_error = found_time - 1 - chunk_start
+
+                    print(f"{method} at {start_time!r} for {duration!r} : found at {found_time - 1:.4f}s (confidence : {confidence:.3f})")
+
+                    assert abs(offset_error) <= MAX_OFFSET_ERROR, f"{method} chunk is off by {offset_error:.4f}s"
+
+        server.shutdown()
+
+    print("OK")
@@ -0,0 +1,32 @@
+import detection.timeline
+
+
+# Checks the segments fitted on the offsets of chunks sampled along an edited permanent video : lone
+# outliers are ignored wherever they are, cuts start a new segment.
+# Run from the repository root : python -m scripts.offset_map_test
+
+DURATION = 600
+
+CASES = [
+    # (points as (chunk time, offset, confidence), expected (offset, points) of each segment)
+    ([(0, 50, .9), (120, 10, .9), (240, 10, .9), (360, 10, .9)], [(10, 3)]),
+    ([(0, 10, .9), (120, 50, .9), (240, 10, .9), (360, 10, .9)], [(10, 3)]),
+    ([(0, 10, .9), (120, 10, .9), (240, 10, .9), (360, 50, .9)], [(10, 3)]),
+    ([(0, 10, .9), (120, 10, .9), (240, 70, .9), (360, 70, .9), (480, 70, .9)], [(10, 2), (70, 3)]),
+    ([(0, 10, .9), (120, 50, .2), (240, 10, .9)], [(10, 2)]),
+    ([(240, 10, .9)], [(10, 1)]),
+    ([(0, 10, .9), (120, 50, .9)], []),
+]
+
+
+if __name__ == "__main__":
+    for points, expected_segments in CASES:
+        offset_map = detection.timeline.fit_offset_map(points, DURATION)
+        segments = [(segment["offset"], segment["points"]) for segment in offset_map]
+
+        print(f"{points} : {offset_map}")
+
+        assert segments == expected_segments, f"Expected {expected_segments}, got {segments}"
+        assert not offset_map or (offset_map[0]["start"] == 0 and offset_map[-1]["end"] == DURATION)
+
+    print("OK")
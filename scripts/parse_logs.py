@@ -6,7 +6,7 @@ import shutil
 import json
 
 
-LOG_REG = re.compile(r"(?:Starting to download a chunk of (\d{2}:\d{2}:\d{2}) of (https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b(?:[-a-zA-Z0-9()@:%_\+.~#?&\/=]*)) at (\d{2}:\d{2}:\d{2})|Download duration : (\d{2}:\d{2}:\d{2})|Found sample \(maybe\) in permanent video at (\d{2}:\d{2}:\d{2})|Search duration : (\d{2}:\d{2}:\d{2})|Calculated time offset: (-?\d+(?:.\d*)?))")
+LOG_REG = re.compile(r"(?:Starting to download a chunk of (\d{2}:\d{2}:\d{2}) of (https?:\/\/(?:www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b(?:[-a-zA-Z0-9()@:%_\+.~#?&\/=]*)) at (\d{2}:\d{2}:\d{2})|Download duration : (\d{2}:\d{2}:\d{2})|Found sample \(maybe\) in permanent video at (\d{2}:\d{2}:\d{2})|Search duration : (\d{2}:\d{2}:\d{2})|Calculated time offset: (-?\d+(?:.\d*)?)|Verification at \d+% : (OK|FAILED)|Template length : (\d+)s|Accepted sample in reference video at (\d{2}:\d{2}:\d{2})|Verification result : (VERIFIED|FAILED))")
 FILENAME_REG = re.compile(r"([a-z0-9_]+)_(\d+)_(\d+)_([a-z0-9-_]+)\.log", re.I)
 LOGS_DIR = "C:/Users/DiFFtY/Downloads/Telegram Desktop/vod_cutter (2)/metadatas_02/OK_AND_UPGRADED"
 LOGS_DIR = "C:/Users/DiFFtY/Downloads/Telegram Desktop/vod_cutter (2)/metadatas_03"
@@ -37,6 +37,8 @@ with open("results.csv", "w", newline='') as csvfile:
         "found_pos",
         "dl_duration",
         "search_duration",
+        "verified",
+        "template_length",
     ])
 
     for log_filename in os.listdir(LOGS_DIR):
@@ -70,18 +72,38 @@ with open("results.csv", "w", newline='') as csvfile:
             fp_log = open(log_filepath, "r")
             
             parse_log_res = LOG_REG.findall(fp_log.read())
-            if parse_log_res:
+            if parse_log_res and not parse_log_res[0][1]:
+                # Offset map logs (downloader.find_offset_map) have no single chunk to report
+                print(f"<i> {log_filename} isn't a single chunk log, skipping.")
+                continue
+            elif parse_log_res:
                 chunk_duration = parse_log_res[0][0]
                 perm_url = parse_log_res[0][1]
                 chunk_pos_in_perm = parse_log_res[0][2]
-                dl_duration = parse_log_res[1][3]
-                sample_pos = parse_log_res[2][4]
-                search_duration = parse_log_res[3][5]
-                processed_time_offset = parse_log_res[4][6]
+                # Looked up by group : newer logs have more lines between these ones
+                dl_duration = next(r[3] for r in parse_log_res if r[3])
+                sample_pos = next(r[4] for r in parse_log_res if r[4])
+                search_duration = next(r[5] for r in parse_log_res if r[5])
+                processed_time_offset = next((r[6] for r in parse_log_res if r[6]), "")
                 
             else:
                 raise Exception(f"<!!> Can't properly parse data in log {log_filename}")
 
+            # The final verdict and the accepted match (maybe a later peak than the first found one) are
+            # logged on their own lines, older logs only have the verification of each position
+            verdict = next((r[10] for r in parse_log_res if r[10]), "")
+
+            if verdict:
+                verified = verdict == "VERIFIED"
+            else:
+                verification_results = [r[7] for r in parse_log_res if r[7]]
+                verified = "" if not verification_results else all(r == "OK" for r in verification_results)
+
+            sample_pos = next((r[9] for r in parse_log_res if r[9]), sample_pos)
+
+            # Length of the template that gave the reported match, missing from older logs
+            template_length = next((r[8] for r in parse_log_res if r[8]), "")
+
             time_offset = round(float(parse_str_time(sample_pos) - parse_str_time(chunk_pos_in_perm)), 3)
 
             if time_offset < -10:
@@ -101,6 +123,8 @@ with open("results.csv", "w", newline='') as csvfile:
                 sample_pos,
                 dl_duration,
                 search_duration,
+                verified,
+                template_length,
             ])
 
             #shutil.copyfile(f"{LOGS_DIR}/{log_filename}", f"{OK_LOGS_DIR}/{log_filename}")
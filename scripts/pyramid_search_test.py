@@ -0,0 +1,70 @@
+import os
+import time
+import itertools
+import tempfile
+
+import numpy as np
+import soundfile
+
+import detection.sound
+from scripts.bench_find_audio_sample import generate_source
+
+
+# Checks that the coarse-to-fine search finds exactly the same sample as the full resolution search,
+# at least MIN_SPEEDUP times faster over all the searches, from templates as noisy as re-encoded uploads
+# (confidences down to about 0.5). The first search of each source also writes its decimated copy.
+# Run from the repository root : python -m scripts.pyramid_search_test
+
+RATE = 8000
+SOURCE_DURATION = 1200
+TEMPLATE_DURATION = 20
+TEMPLATE_POSITIONS = [0, 12.345, 299.99, 321.123375, 333.33325, 431.000125, 500.00075, SOURCE_DURATION - TEMPLATE_DURATION]
+SOURCE_SEEDS = [1, 3]   # At 1000 Hz, the coarse pass misses some seed 1 templates : they are searched again at 2000 Hz
+TEMPLATE_NOISES = [0.05, 0.3]
+MIN_SPEEDUP = 4
+
+
+if __name__ == "__main__":
+    # Noisy copies of the templates, like a re-encoded permanent upload
+    rng = np.random.default_rng(2)
+
+    total_full_search_time = 0.
+    total_pyramid_search_time = 0.
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for source_seed, template_noise in itertools.product(SOURCE_SEEDS, TEMPLATE_NOISES):
+            source_sound = generate_source(SOURCE_DURATION, RATE, seed=source_seed)
+
+            source_path = os.path.join(tmp_dir, "source.wav")
+            soundfile.write(source_path, source_sound, RATE)
+
+            for template_position in TEMPLATE_POSITIONS:
+                template_start = round(template_position * RATE)
+                template_sound = source_sound[template_start:template_start + TEMPLATE_DURATION * RATE]
+                template_sound = template_sound + template_noise * rng.standard_normal(template_sound.shape[0]).astype(np.float32)
+
+                template_path = os.path.join(tmp_dir, "template.wav")
+                soundfile.write(template_path, template_sound, RATE)
+
+                t_start = time.time()
+                full_time, full_value = detection.sound.find_audio_sample_fft(source_path, template_path, normalized=True)
+                full_search_time = time.time() - t_start
+
+                t_start = time.time()
+                pyramid_time, pyramid_value = detection.sound.find_audio_sample_pyramid(source_path, template_path)
+                pyramid_search_time = time.time() - t_start
+
+                total_full_search_time += full_search_time
+                total_pyramid_search_time += pyramid_search_time
+
+                print(f"Seed {source_seed}, noise {template_noise}, template at {template_start / RATE}s : full search {full_time}s in {full_search_time:.2f}s, pyramid search {pyramid_time}s in {pyramid_search_time:.2f}s")
+
+                assert full_time == template_start / RATE, f"Full search missed the template ({full_time}s)"
+                assert pyramid_time == full_time, f"Pyramid search differs from the full search ({pyramid_time}s != {full_time}s)"
+                assert abs(pyramid_value - full_value) < 1e-6
+
+    print(f"Full search : {total_full_search_time:.2f}s, pyramid search : {total_pyramid_search_time:.2f}s")
+
+    assert total_pyramid_search_time * MIN_SPEEDUP < total_full_search_time, f"Pyramid search is only {total_full_search_time / total_pyramid_search_time:.1f} times faster than the full search"
+
+    print("OK")
@@ -0,0 +1,37 @@
+import numpy as np
+
+import detection.selection
+
+
+# Checks that the template selection doesn't pick a window straddling a silence : the jump from speech to
+# silence must not count as loudness dynamics.
+# Run from the repository root : python -m scripts.template_selection_test
+
+RATE = 4000
+DURATION = 60
+SILENCE = (20, 30)
+TEMPLATE_DURATION = 15
+
+
+def generate_speech_like(duration, rate, seed=0):
+    # Noise modulated by syllable-like bursts of a few Hz
+    rng = np.random.default_rng(seed)
+    t = np.arange(duration * rate) / rate
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t + 3 * np.sin(2 * np.pi * 0.3 * t))
+    return (0.3 * envelope * rng.standard_normal(t.shape[0])).astype(np.float32)
+
+
+if __name__ == "__main__":
+    sound = generate_speech_like(DURATION, RATE)
+    sound[SILENCE[0] * RATE:SILENCE[1] * RATE] = 0
+
+    loudness, entropy = detection.selection.get_envelope([sound], RATE)
+    window_start, window_score = detection.selection.select_template_window(loudness, entropy, TEMPLATE_DURATION)
+    window_end = window_start + TEMPLATE_DURATION
+
+    print(f"Selected window : {window_start}s - {window_end}s (score : {round(window_score, 3)})")
+
+    assert window_score > 0
+    assert window_end <= SILENCE[0] or window_start >= SILENCE[1], "The selected window overlaps the silence"
+
+    print("OK")
@@ -0,0 +1,144 @@
+import os
+import re
+import csv
+import json
+import time
+import itertools
+
+import numpy as np
+
+import detection.sound
+import detection.pcm
+from medias import download_audio
+
+
+# Replays the jobs of results.csv (see scripts/parse_logs.py) with other detection parameters : sample
+# rate, template length and the parameters of each backend. Audio is downloaded once per rate into
+# CACHE_DIR. The Pareto front of search time against offset error is printed and saved, and the
+# fastest setting that gets every job right is written as a preset for find_offset(preset=...).
+# Run from the repository root : python -m scripts.tune_detection
+
+RESULTS_PATH = "results.csv"
+CACHE_DIR = "tuning_cache"
+OUTPUT_PATH = "tuning_results.json"
+PRESET_PATH = "search_preset.json"
+MAX_JOBS = 20
+
+RATES = [4000, 8000, 16000]
+TEMPLATE_DURATIONS = [8, 16, 32, 60]
+BACKEND_PARAMS = {
+    "pcm": [{"coarse_rate": coarse_rate} for coarse_rate in [500, 1000, 2000]],
+    "feature": [{"hop_length": hop_length} for hop_length in [64, 128, 256]],
+    "fft": [{}],
+}
+MAX_OFFSET_ERROR = 1.0  # Offsets in results.csv are whole seconds
+
+
+def parse_str_time(time_str):
+    res = re.search(r"(\d+):(\d+):(\d+)", time_str)
+    return int(res.group(1)) * 3600 + int(res.group(2)) * 60 + int(res.group(3))
+
+
+def read_jobs(results_path):
+    with open(results_path, "r", newline="") as fp:
+        rows = list(csv.DictReader(fp, delimiter=",", quotechar="|"))
+
+    return [{
+        "src_id": row["src_id"],
+        "prm_id": row["prm_id"],
+        "src_url": row["src_url"],
+        "prm_url": row["prm_url"],
+        "sample_pos": parse_str_time(row["sample_pos"]),
+        "time_offset": float(row["time_offset"]),
+    } for row in rows[:MAX_JOBS]]
+
+
+def get_job_audio(job, rate):
+    ref_audio_path = f"{CACHE_DIR}/{job['src_id']}_{rate}.pcm"
+    prm_audio_path = f"{CACHE_DIR}/{job['prm_id']}_{job['sample_pos']}_{rate}.wav"
+
+    if not os.path.exists(ref_audio_path):
+        download_audio(job["src_url"], f"{CACHE_DIR}/temp_ref_audio.wav", rate=rate)
+        detection.pcm.convert_to_pcm(f"{CACHE_DIR}/temp_ref_audio.wav", ref_audio_path)
+        os.remove(f"{CACHE_DIR}/temp_ref_audio.wav")
+
+    if not os.path.exists(prm_audio_path):
+        download_audio(job["prm_url"], prm_audio_path, start_time=job["sample_pos"], duration=max(TEMPLATE_DURATIONS), rate=rate)
+
+    return ref_audio_path, prm_audio_path
+
+
+def search(backend, params, ref_audio_path, template_sound):
+    if backend == "pcm":
+        return detection.sound.find_audio_samples(ref_audio_path, [template_sound], **params)[0]
+
+    return detection.sound.MATCHERS[backend](ref_audio_path, template_sound, **params)
+
+
+def get_pareto_front(runs):
+    # Runs no other run beats on both search time and offset error
+    return [run for run in runs if not any(
+        other["search_time"] <= run["search_time"] and other["offset_error"] <= run["offset_error"] and
+        (other["search_time"] < run["search_time"] or other["offset_error"] < run["offset_error"])
+        for other in runs)]
+
+
+if __name__ == "__main__":
+    if not os.path.isdir(CACHE_DIR):
+        os.makedirs(CACHE_DIR)
+
+    jobs = read_jobs(RESULTS_PATH)
+    runs = []
+
+    for rate in RATES:
+        job_audios = [get_job_audio(job, rate) for job in jobs]
+
+        for backend, template_duration in itertools.product(BACKEND_PARAMS, TEMPLATE_DURATIONS):
+            for params in BACKEND_PARAMS[backend]:
+                search_times = []
+                offset_errors = []
+
+                for job, (ref_audio_path, prm_audio_path) in zip(jobs, job_audios):
+                    template_sound = detection.sound.load_template(prm_audio_path, rate=rate)[:template_duration * rate]
+
+                    t_start = time.time()
+                    found_time, confidence = search(backend, params, ref_audio_path, template_sound)
+                    search_times.append(time.time() - t_start)
+
+                    offset_errors.append(abs(found_time - job["sample_pos"] - job["time_offset"]))
+
+                runs.append({
+                    "backend": backend,
+                    "rate": rate,
+                    "template_duration": template_duration,
+                    "params": params,
+                    "search_time": float(np.mean(search_times)),
+                    "offset_error": float(np.mean(offset_errors)),
+                    "success_rate": float(np.mean([offset_error <= MAX_OFFSET_ERROR for offset_error in offset_errors])),
+                })
+
+                print(f"{backend:>8} {rate:>5}Hz {template_duration:>2}s {json.dumps(params):<22} : {runs[-1]['search_time']:7.2f}s, offset error {runs[-1]['offset_error']:8.3f}s, success {runs[-1]['success_rate']:.0%}")
+
+    pareto_front = sorted(get_pareto_front(runs), key=lambda run: run["search_time"])
+
+    print("Pareto front :")
+    for run in pareto_front:
+        print(f"{run['backend']:>8} {run['rate']:>5}Hz {run['template_duration']:>2}s {json.dumps(run['params']):<22} : {run['search_time']:7.2f}s, offset error {run['offset_error']:8.3f}s, success {run['success_rate']:.0%}")
+
+    with open(OUTPUT_PATH, "w") as fp:
+        json.dump({"jobs": len(jobs), "runs": runs, "pareto_front": pareto_front}, fp, indent=4)
+
+    reliable_runs = [run for run in runs if run["success_rate"] == 1]
+
+    if reliable_runs:
+        best_run = min(reliable_runs, key=lambda run: run["search_time"])
+    else:
+        best_run = min(runs, key=lambda run: run["offset_error"])
+        print("<!> No setting found every offset, keeping the most accurate one")
+
+    preset = {key: best_run[key] for key in ["backend", "rate", "template_duration", "params"]}
+
+    with open(PRESET_PATH, "w") as fp:
+        json.dump(preset, fp, indent=4)
+
+    print(f"Preset written to {PRESET_PATH} : {preset}")
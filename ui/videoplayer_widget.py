@@ -1,6 +1,6 @@
 import re
 
-import streamlink
+from medias.resolver import resolve_streams
 
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QWidget
@@ -38,9 +38,9 @@ class MediaPlayer(QWidget):
         if re.search(r"^(?:/|[a-z]:[\\/])", file_url, re.I):
             url = QUrl.fromLocalFile(file_url)
         else:
-            streams = streamlink.streams(file_url)
+            streams = resolve_streams(file_url)
             if streams:
-                url = QUrl(streams["best"].url)
+                url = QUrl(streams["best"])
             else:
                 url = QUrl(file_url)
         
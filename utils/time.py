@@ -8,7 +8,6 @@ def format_time(seconds):
 
 
 def parse_duration(d):
-    print(d)
     duration_regex = re.search("(?:([0-9]+)h)?(?:([0-9]+)m)?([0-9]+)s", d, re.I)
     if duration_regex:
         hours = duration_regex.group(1)
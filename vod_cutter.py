@@ -9,13 +9,13 @@ import urllib.parse
 import xml.etree.ElementTree as ET
 
 import requests
-import streamlink
 
 import config
 from utils.time import format_time, parse_duration
 from interface.vlc import VLCInterface
 from interface.twitch import TwitchInterface
 from ui.videoplayer_widget import MediaPlayer
+from medias.resolver import resolve_streams
 
 from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QApplication, QMainWindow
@@ -294,9 +294,9 @@ class VODCutter(QMainWindow):
                 file_url = filepath
 
             if not self.loaded_video.is_local:
-                streams = streamlink.streams(file_url)
+                streams = resolve_streams(file_url)
                 if streams:
-                    self.loaded_video.filepath = streams["best"].url
+                    self.loaded_video.filepath = streams["best"]
                 else:
                     self.loaded_video.filepath = file_url
             else:
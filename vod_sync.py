@@ -20,6 +20,7 @@ from interface.twitch import TwitchInterface
 from ui.filepicker_widget import FilePicker
 from playlist import Playlist
 from medias import get_video_duration
+from medias.resolver import resolve_streams
 from metadatas import get_metadata_filename
 from metadatas.write import export_metadatas, write_metadatas
 
@@ -34,7 +35,6 @@ from PySide2.QtWidgets import QFileDialog
 from PySide2.QtCore import Signal, Qt
 
 from streamlink.stream.http import HTTPStream
-from streamlink.stream.ffmpegmux import MuxedStream
 
 
 # SNIPPETS
@@ -284,13 +284,11 @@ class VideoDeck(QWidget):
                 video_url = url
 
             def find_suitable_stream(streams):
-                best_stream = streams.get("best", None)
+                # Muxed streams are already resolved to their first substream
+                best_stream_url = streams.get("best", None)
 
-                if best_stream:
-                    if type(best_stream) is MuxedStream:
-                        return best_stream.substreams[0].url
-                    else:
-                        return best_stream.url
+                if best_stream_url:
+                    return best_stream_url
                 else:
                     raise Exception(f"<!!> Can't find best stream")
 
@@ -298,7 +296,7 @@ class VideoDeck(QWidget):
                 streams = []
 
                 try:
-                    streams = streamlink.streams(video_url)
+                    streams = resolve_streams(video_url)
                 except streamlink.exceptions.PluginError as e:
                     print(f"<!!> Error while loading video {video_url} : {e}")
                     ydl = YoutubeDL(params={"noplaylist": True})